@@ -0,0 +1,95 @@
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+
+class DocumentCache:
+    """готовые документы на диске с вытеснением давно не читанных.
+
+    Время изменения файла обновляется при каждом чтении, при записи
+    самые старые файлы удаляются, пока каталог больше max_size байт.
+    """
+    temporary_ttl = 60 * 60
+
+    def __init__(self, location, max_size):
+        self.location = location
+        self.max_size = max_size
+
+    def path(self, name):
+        return os.path.join(self.location, name)
+
+    def open(self, name):
+        """файл документа или None, если его нет в кэше."""
+        try:
+            file = open(self.path(name), 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(file.name)
+        except OSError:
+            pass
+        return file
+
+    def tee(self, name, chunks, group=None):
+        """отдаёт chunks дальше и сохраняет их копию под именем name.
+
+        Файл появляется в кэше только после полной записи; оборванная
+        отдача оставляет кэш без изменений. Файлы, чьё имя начинается с
+        group, а основа имени до точки другая, - прошлые версии, они
+        удаляются.
+        """
+        os.makedirs(self.location, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(
+            dir=self.location, prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+            os.replace(temporary, self.path(name))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.evict(current=name, group=group)
+
+    def evict(self, current=None, group=None):
+        stem = current.split('.')[0] if current else None
+        expired = time.time() - self.temporary_ttl
+        entries, total = [], 0
+        with os.scandir(self.location) as scan:
+            for entry in scan:
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith('.tmp-'):
+                    if stat.st_mtime < expired:
+                        self.remove(entry.path)
+                    continue
+                if (group and entry.name.startswith(group)
+                        and entry.name.split('.')[0] != stem):
+                    self.remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+shopping_lists = DocumentCache(
+    settings.SHOPPING_LIST_CACHE['LOCATION'],
+    settings.SHOPPING_LIST_CACHE['MAX_SIZE'],
+)
@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from django.db.models import F
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from recipes.models import ShoppingCartIngredient
+from .pdf import render_pdf
+
+TITLE = 'Список покупок'
+FIELDS = ('name', 'amount', 'measurement_unit')
+
+
+def shopping_list_rows(user):
+    """готовые суммы ингредиентов корзины без загрузки в память."""
+    return ShoppingCartIngredient.objects.filter(user=user).values(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+        amount=F('total_amount'),
+    ).order_by('name').iterator()
+
+
+def line(row):
+    return f'{row["name"]} - {row["amount"]} {row["measurement_unit"]}'
+
+
+def export_txt(rows):
+    yield f'{TITLE}:\n'.encode()
+    for row in rows:
+        yield f'{line(row)}\n'.encode()
+
+
+def export_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('﻿')
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow([row[field] for field in FIELDS])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def export_json(rows):
+    separator = '['
+    for row in rows:
+        yield (separator + json.dumps(
+            {field: row[field] for field in FIELDS},
+            ensure_ascii=False)).encode()
+        separator = ','
+    yield b'[]' if separator == '[' else b']'
+
+
+def export_pdf(rows):
+    return render_pdf(
+        TITLE, (line(row) for row in rows), settings.SHOPPING_LIST_FONT)
+
+
+class PlainTextRenderer(BaseRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(f'{key}: {value}' for key, value in data.items())
+        return str(data).encode()
+
+
+class CSVRenderer(PlainTextRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PDFRenderer(PlainTextRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+EXPORT_RENDERERS = (
+    PlainTextRenderer, CSVRenderer, JSONRenderer, PDFRenderer,
+)
+
+EXPORTS = {
+    'txt': export_txt,
+    'csv': export_csv,
+    'json': export_json,
+    'pdf': export_pdf,
+}
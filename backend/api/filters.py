@@ -1,24 +1,33 @@
-import django_filters
+import re
+
+from django.db import connections
+from django.db.models import (BooleanField, Case, FloatField, IntegerField,
+                              Value, When)
+from django.db.models.expressions import RawSQL
 from django_filters import rest_framework as filter
 
 
-from recipes.models import Recipe, Ingredient
+from recipes.models import Recipe, Tag
 from users.models import User
 
 
 class RecipeFilter(filter.FilterSet):
     author = filter.ModelChoiceFilter(
         queryset=User.objects.all())
-    tags = filter.AllValuesMultipleFilter(
-        field_name='tags__slug'
+    tags = filter.ModelMultipleChoiceFilter(
+        field_name='tags__slug',
+        to_field_name='slug',
+        queryset=Tag.objects.all()
     )
     is_favorited = filter.BooleanFilter(method='get_favorite')
     is_in_shopping_cart = filter.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = filter.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search']
 
     def get_favorite(self, queryset, name, value):
         if value:
@@ -30,11 +39,38 @@ class RecipeFilter(filter.FilterSet):
             return queryset.filter(shopping_cart__user=self.request.user)
         return queryset
 
+    def get_search(self, queryset, name, value):
+        """поиск по названию, описанию и ингредиентам с ранжированием."""
+        value = value.strip()
+        if not value:
+            return queryset
+        if connections[queryset.db].vendor == 'postgresql':
+            return self.search_postgres(queryset, value)
+        return self.search_portable(queryset, value)
 
-class IngredientFilter(django_filters.FilterSet):
-    name = django_filters.filters.CharFilter(
-        field_name='name', lookup_expr='icontains')
+    def search_postgres(self, queryset, value):
+        """GIN-индекс по search_vector, русская морфология."""
+        query = "plainto_tsquery('russian', %s)"
+        return queryset.annotate(
+            search_match=RawSQL(
+                f'search_vector @@ {query}', (value,),
+                output_field=BooleanField()),
+            search_rank=RawSQL(
+                f'ts_rank(search_vector, {query})', (value,),
+                output_field=FloatField()),
+        ).filter(search_match=True).order_by(
+            '-search_rank', '-pub_date', '-id')
 
-    class Meta:
-        model = Ingredient
-        fields = ('name', )
+    def search_portable(self, queryset, value):
+        """все слова запроса в search_document, совпадения в названии выше."""
+        rank = Value(0, output_field=IntegerField())
+        for term in value.lower().replace('ё', 'е').split():
+            queryset = queryset.filter(search_document__contains=term)
+            rank = rank + Case(
+                When(search_document__regex=r'^[^\n]*' + re.escape(term),
+                     then=Value(2)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        return queryset.annotate(search_rank=rank).order_by(
+            '-search_rank', '-pub_date', '-id')
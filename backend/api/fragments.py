@@ -0,0 +1,57 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch, prefetch_related_objects
+
+from recipes.models import RecipeIngredient
+from .versions import RECIPES, get_versions
+
+CATALOG = 'catalog'
+# меняется вместе с набором полей фрагмента
+FRAGMENT_SCHEMA = 2
+
+RECIPE_PREFETCH = (
+    'tags',
+    Prefetch(
+        'recipeingredient_set',
+        queryset=RecipeIngredient.objects.select_related('ingredient')
+    ),
+)
+
+
+def fragment_keys(recipes, request):
+    """ключи по id и pub_date рецепта, версиям и хосту.
+
+    pub_date обновляется при каждом сохранении рецепта, но не при правке
+    его ингредиентов и тэгов отдельно от него: их сигналы сдвигают версию
+    RECIPES. Версия CATALOG - при правке справочников и профилей авторов.
+    """
+    catalog, recipes_version = get_versions(CATALOG, RECIPES)
+    base = request.build_absolute_uri('/') if request is not None else ''
+    host = hashlib.md5(base.encode()).hexdigest()[:8]
+    return {
+        recipe.pk: (
+            f'recipe:{FRAGMENT_SCHEMA}:{recipe.pk}:'
+            f'{recipe.pub_date.timestamp()}:'
+            f'{catalog}:{recipes_version}:{host}'
+        )
+        for recipe in recipes
+    }
+
+
+def get_fragments(recipes, request, render):
+    """представления рецептов без полей текущего пользователя.
+
+    Всё, что есть в кэше, читается одним get_many, остальное
+    отрисовывается render после одной подгрузки тэгов и ингредиентов.
+    """
+    keys = fragment_keys(recipes, request)
+    fragments = cache.get_many(keys.values())
+    missing = [recipe for recipe in recipes if keys[recipe.pk] not in fragments]
+    if missing:
+        prefetch_related_objects(missing, *RECIPE_PREFETCH)
+        rendered = {keys[recipe.pk]: render(recipe) for recipe in missing}
+        cache.set_many(rendered, settings.RECIPE_FRAGMENT_TTL)
+        fragments.update(rendered)
+    return [fragments[keys[recipe.pk]] for recipe in recipes]
@@ -0,0 +1,104 @@
+from rest_framework import serializers
+
+from recipes.models import Favorite, ShoppingList
+from users.models import Followers
+
+FAVORITES = 'favorites'
+SHOPPING_CART = 'shopping_cart'
+SUBSCRIPTIONS = 'subscriptions'
+
+RELATIONS = {
+    FAVORITES: (Favorite, 'recipe_id'),
+    SHOPPING_CART: (ShoppingList, 'recipe_id'),
+    SUBSCRIPTIONS: (Followers, 'author_id'),
+}
+
+
+class ViewerState:
+    """избранное, корзина и подписки текущего пользователя.
+
+    Собирает id объектов страницы и отвечает на вопросы сериализаторов
+    из памяти: на каждую связь уходит один запрос с IN.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._pending = {relation: set() for relation in RELATIONS}
+        self._loaded = {relation: set() for relation in RELATIONS}
+        self._matched = {relation: set() for relation in RELATIONS}
+
+    @classmethod
+    def from_context(cls, context):
+        """один загрузчик на запрос, общий для вложенных сериализаторов."""
+        state = context.get('viewer_state')
+        if state is not None:
+            return state
+        request = context.get('request')
+        state = getattr(request, '_viewer_state', None)
+        if state is None:
+            state = cls(getattr(request, 'user', None))
+            if request is not None:
+                request._viewer_state = state
+        context['viewer_state'] = state
+        return state
+
+    @property
+    def is_anonymous(self):
+        return self.user is None or self.user.is_anonymous
+
+    def prime(self, relation, ids):
+        """запоминает id, которые понадобятся при отрисовке страницы."""
+        if self.is_anonymous:
+            return
+        self._pending[relation].update(
+            pk for pk in ids if pk not in self._loaded[relation])
+
+    def prime_recipes(self, recipes):
+        recipes = list(recipes)
+        ids = [recipe.id for recipe in recipes]
+        self.prime(FAVORITES, ids)
+        self.prime(SHOPPING_CART, ids)
+        self.prime(SUBSCRIPTIONS, [recipe.author_id for recipe in recipes])
+
+    def prime_users(self, users):
+        self.prime(SUBSCRIPTIONS, [user.id for user in users])
+
+    def contains(self, relation, pk):
+        if self.is_anonymous:
+            return False
+        if pk not in self._loaded[relation]:
+            self._pending[relation].add(pk)
+            self._load(relation)
+        return pk in self._matched[relation]
+
+    def is_favorited(self, recipe_id):
+        return self.contains(FAVORITES, recipe_id)
+
+    def is_in_shopping_cart(self, recipe_id):
+        return self.contains(SHOPPING_CART, recipe_id)
+
+    def is_subscribed(self, author_id):
+        return self.contains(SUBSCRIPTIONS, author_id)
+
+    def _load(self, relation):
+        model, field = RELATIONS[relation]
+        pending = self._pending[relation]
+        self._matched[relation].update(
+            model.objects.filter(
+                user=self.user, **{f'{field}__in': pending}
+            ).values_list(field, flat=True)
+        )
+        self._loaded[relation].update(pending)
+        self._pending[relation] = set()
+
+
+class ViewerStateListSerializer(serializers.ListSerializer):
+    """перед отрисовкой списка сообщает загрузчику id всей страницы."""
+
+    def to_representation(self, data):
+        if hasattr(data, 'all'):
+            data = data.all()
+        data = list(data)
+        self.child.prime_viewer_state(
+            ViewerState.from_context(self.context), data)
+        return super().to_representation(data)
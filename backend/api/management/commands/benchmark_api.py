@@ -0,0 +1,139 @@
+import json
+from datetime import datetime
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.scenarios import ScenarioError, Scenarios
+from api.stats import percentile
+from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingList
+from users.models import Followers, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку, число SQL-запросов и размер ответа для '
+        'маршрутов API на текущей базе (например, после '
+        'generate_fake_data) и сравнивает прогоны.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default='benchmark.json',
+            help='Куда записать результаты в JSON.')
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--case', action='append', dest='cases',
+            help='Выполнить только сценарии с этим именем.')
+        parser.add_argument(
+            '--compare', nargs=2, metavar=('BASE', 'CURRENT'),
+            help='Сравнить два файла результатов вместо замера.')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост p95 и размера ответа, доля.')
+        parser.add_argument(
+            '--min-delta', type=float, default=1.0,
+            help='Рост p95 меньше стольких мс регрессией не считается.')
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare(*options['compare'], options)
+        try:
+            self.scenarios = Scenarios()
+            results = self.run(options)
+        except ScenarioError as error:
+            raise CommandError(error)
+        report = {'meta': self.meta(options), 'cases': results}
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+    def run(self, options):
+        results = {}
+        for scenario in self.scenarios.cases():
+            if options['cases'] and scenario['name'] not in options['cases']:
+                continue
+            results[scenario['name']] = result = self.measure(
+                scenario, options['iterations'], options['warmup'])
+            self.stdout.write(
+                f'{scenario["name"]:<32} p50 {result["p50"]:8.2f} мс  '
+                f'p95 {result["p95"]:8.2f} мс  '
+                f'p99 {result["p99"]:8.2f} мс  '
+                f'запросов {result["queries"]:>4}  '
+                f'{result["bytes"]:>8} Б')
+        return results
+
+    def measure(self, scenario, iterations, warmup):
+        timings, queries, sizes = [], [], []
+        for number in range(warmup + iterations):
+            sample = self.scenarios.run(scenario)
+            if number < warmup:
+                continue
+            timings.append(sample[0])
+            queries.append(len(sample[1]))
+            sizes.append(sample[2])
+        timings.sort()
+        return {
+            'method': scenario['method'].upper(),
+            'path': scenario['path'],
+            'p50': percentile(timings, 0.5),
+            'p95': percentile(timings, 0.95),
+            'p99': percentile(timings, 0.99),
+            'max': timings[-1],
+            'queries': max(queries),
+            'bytes': max(sizes),
+        }
+
+    @staticmethod
+    def meta(options):
+        return {
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'iterations': options['iterations'],
+            'warmup': options['warmup'],
+            'dataset': {
+                'users': User.objects.count(),
+                'follows': Followers.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'recipe_ingredients': RecipeIngredient.objects.count(),
+                'favorites': Favorite.objects.count(),
+                'carts': ShoppingList.objects.count(),
+            },
+        }
+
+    def compare(self, base_path, current_path, options):
+        """регрессии: больше запросов, рост p95 или размера ответа."""
+        with open(base_path, encoding='utf-8') as file:
+            base = json.load(file)['cases']
+        with open(current_path, encoding='utf-8') as file:
+            current = json.load(file)['cases']
+        threshold = 1 + options['threshold']
+        regressions = []
+        for name in sorted(base.keys() & current.keys()):
+            old, new = base[name], current[name]
+            problems = []
+            if new['queries'] > old['queries']:
+                problems.append(
+                    f'запросов {old["queries"]} -> {new["queries"]}')
+            if (new['p95'] > old['p95'] * threshold
+                    and new['p95'] - old['p95'] > options['min_delta']):
+                problems.append(
+                    f'p95 {old["p95"]:.2f} -> {new["p95"]:.2f} мс')
+            if new['bytes'] > old['bytes'] * threshold:
+                problems.append(f'размер {old["bytes"]} -> {new["bytes"]} Б')
+            mark = 'РЕГРЕССИЯ' if problems else 'ok'
+            self.stdout.write(
+                f'{name:<32} p95 {old["p95"]:8.2f} -> {new["p95"]:8.2f} мс  '
+                f'запросов {old["queries"]:>3} -> {new["queries"]:>3}  '
+                f'{mark} {"; ".join(problems)}')
+            if problems:
+                regressions.append(name)
+        for name in sorted(base.keys() ^ current.keys()):
+            self.stdout.write(f'{name:<32} есть только в одном прогоне')
+        if regressions:
+            raise CommandError(
+                f'Регрессии в сценариях: {", ".join(regressions)}')
+        self.stdout.write('Регрессий нет.')
@@ -0,0 +1,68 @@
+import csv
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.search import IngredientIndex, normalize
+from api.stats import percentile
+
+ALPHABET = 'абвгдежзийклмнопрстуфхцчшщъыьэюя'
+
+
+def make_typo(word, rng):
+    """одна случайная опечатка: замена, пропуск, перестановка или ё."""
+    position = rng.randrange(len(word))
+    kind = rng.choice(('replace', 'delete', 'swap', 'yo'))
+    if kind == 'yo' and 'е' in word:
+        return word.replace('е', 'ё', 1)
+    if kind == 'delete' and len(word) > 3:
+        return word[:position] + word[position + 1:]
+    if kind == 'swap' and position < len(word) - 1:
+        return (word[:position] + word[position + 1]
+                + word[position] + word[position + 2:])
+    return word[:position] + rng.choice(ALPHABET) + word[position + 1:]
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку поиска ингредиентов в памяти '
+            'на запросах с опечатками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default='./data/ingredients.csv',
+            help='CSV с ингредиентами: название,единица измерения.')
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        with open(options['path'], newline='', encoding='utf-8') as file:
+            index = IngredientIndex(
+                {'id': number, 'name': row[0], 'measurement_unit': row[1]}
+                for number, row in enumerate(csv.reader(file)))
+        self.stdout.write(f'Ингредиентов в индексе: {len(index.items)}')
+        rng = random.Random(options['seed'])
+        queries = []
+        for _ in range(options['queries']):
+            name = normalize(rng.choice(index.items)['name'])
+            typed = name[:rng.randint(min(4, len(name)), len(name))]
+            queries.append((name, make_typo(typed, rng)))
+        for mode, fuzzy in (('auto', None), ('exact', False), ('fuzzy', True)):
+            self.report(mode, index, queries, fuzzy)
+
+    def report(self, mode, index, queries, fuzzy):
+        timings = []
+        found = 0
+        for name, query in queries:
+            started = time.perf_counter()
+            results = index.search(query, fuzzy)
+            timings.append((time.perf_counter() - started) * 1000)
+            found += any(normalize(item['name']) == name for item in results)
+        timings.sort()
+        self.stdout.write(
+            f'{mode:>6}: p50 {percentile(timings, 0.5):.3f} мс, '
+            f'p95 {percentile(timings, 0.95):.3f} мс, '
+            f'p99 {percentile(timings, 0.99):.3f} мс, '
+            f'max {timings[-1]:.3f} мс, '
+            f'найдено {found / len(queries):.0%}'
+        )
@@ -0,0 +1,40 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """ETag и Last-Modified для list/retrieve.
+
+    Представление возвращает из get_conditional_validators() части ETag и
+    время изменения. Совпавший If-None-Match/If-Modified-Since получает 304
+    без выборки и сериализации.
+    """
+
+    def get_conditional_validators(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(super().retrieve, request, *args, **kwargs)
+
+    def conditional(self, render, request, *args, **kwargs):
+        parts, last_modified = self.get_conditional_validators()
+        if parts is None:
+            return render(request, *args, **kwargs)
+        signature = repr([request.get_full_path(), *parts]).encode()
+        etag = quote_etag(hashlib.md5(signature).hexdigest())
+        last_modified = last_modified and int(last_modified)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = render(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Authorization',))
+        return response
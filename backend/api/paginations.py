@@ -1,6 +1,230 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import hashlib
+import json
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .versions import get_versions, viewer_namespaces
+
+COUNT_EXACT = 'exact'
+COUNT_CACHED = 'cached'
+COUNT_ESTIMATE = 'estimate'
+
+
+class CountingPaginator(Paginator):
+    """Paginator, который не считает COUNT(*) на каждый запрос.
+
+    Режим задаётся settings.PAGINATION_COUNT['MODE']:
+    exact - точный подсчёт как раньше;
+    cached - точное значение в кэше по подписи фильтра на TTL секунд;
+    estimate - оценка планировщика Postgres выше порога ESTIMATE_THRESHOLD,
+    ниже порога и на других базах - как cached.
+    Ключ кэша включает версии namespaces, которые сдвигаются при записи
+    рецептов, избранного, корзины и подписок.
+    """
+
+    def __init__(self, *args, namespaces=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namespaces = namespaces
+
+    @cached_property
+    def count(self):
+        options = settings.PAGINATION_COUNT
+        mode = options['MODE']
+        if mode == COUNT_EXACT or not hasattr(self.object_list, 'query'):
+            return super().count
+        if mode == COUNT_ESTIMATE:
+            estimate = self.estimate()
+            if estimate is not None and (
+                    estimate >= options['ESTIMATE_THRESHOLD']):
+                return estimate
+        key = self.cache_key()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, options['TTL'])
+        return count
+
+    def cache_key(self):
+        sql, params = self.object_list.query.sql_with_params()
+        signature = repr((
+            sql, params, get_versions(*self.namespaces))).encode()
+        return f'count:{hashlib.md5(signature).hexdigest()}'
+
+    def estimate(self):
+        """число строк по оценке EXPLAIN, None если база не Postgres."""
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = self.object_list.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """постраничный вывод по ключу вместо OFFSET и COUNT(*).
+
+    Страница выбирается условием по полям сортировки view.keyset_ordering,
+    в ответе только непрозрачные ссылки next/previous.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 6
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = [
+            (field.lstrip('-'), field.startswith('-'))
+            for field in view.keyset_ordering
+        ]
+        position, reverse = self.decode_cursor(request, queryset.model)
+        page_size = self.get_page_size(request)
+
+        if position is not None:
+            queryset = queryset.filter(self.keyset_filter(position, reverse))
+        queryset = queryset.order_by(*self.order_by(reverse))
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.next_position = self.previous_position = None
+        if results and (has_more or reverse):
+            self.next_position = self.position(results[-1])
+        if results and (has_more if reverse else position is not None):
+            self.previous_position = self.position(results[0])
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_link(self.next_position, reverse=False),
+            'previous': self.get_link(self.previous_position, reverse=True),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size < 1:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def order_by(self, reverse):
+        return [
+            f'{"-" if descending != reverse else ""}{field}'
+            for field, descending in self.ordering
+        ]
+
+    def keyset_filter(self, position, reverse):
+        """(a, b) после (a0, b0): a < a0 или a = a0 и b < b0."""
+        condition = Q()
+        equal = {}
+        for (field, descending), value in zip(self.ordering, position):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def position(self, obj):
+        values = []
+        for field, _ in self.ordering:
+            value = getattr(obj, field)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        return values
+
+    def decode_cursor(self, request, model):
+        """позиция из курсора, значения приведены к типам полей."""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            position, reverse = cursor['p'], bool(cursor.get('r'))
+            if (not isinstance(position, list)
+                    or len(position) != len(self.ordering)):
+                raise ValueError(position)
+            position = [
+                self.parse_value(model, field, value)
+                for (field, _), value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    @staticmethod
+    def parse_value(model, field, value):
+        if value is None or isinstance(value, (list, dict, bool)):
+            raise ValueError(value)
+        return model._meta.get_field(field).to_python(value)
+
+    def get_link(self, position, reverse):
+        if position is None:
+            return None
+        cursor = {'p': position}
+        if reverse:
+            cursor['r'] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(cursor, separators=(',', ':')).encode()).decode()
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, encoded)
 
 
 class CustomPagination(PageNumberPagination):
+    """page/limit по умолчанию, по ключу при наличии параметра cursor.
+
+    Курсорный режим включается параметром ?cursor= (пустым для первой
+    страницы) на представлениях, у которых задан keyset_ordering.
+    Параметры из view.keyset_skip_params задают свою сортировку,
+    например по рангу поиска: с ними всегда выдаются обычные страницы.
+    """
     page_size_query_param = 'limit'
     page_size = 6
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.use_keyset(request, view):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.django_paginator_class = partial(
+            CountingPaginator,
+            namespaces=[queryset.model._meta.label_lower]
+            + viewer_namespaces(request.user)
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    @staticmethod
+    def use_keyset(request, view):
+        params = request.query_params
+        return bool(
+            getattr(view, 'keyset_ordering', None)
+            and KeysetPagination.cursor_query_param in params
+            and not any(params.get(name) for name in getattr(
+                view, 'keyset_skip_params', ())))
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,363 @@
+"""Потоковая запись PDF со встроенным подмножеством TrueType-шрифта.
+
+Страницы отдаются по мере готовности, шрифт с использованными глифами
+дописывается в конец файла, поэтому память не зависит от числа строк.
+"""
+import struct
+import zlib
+from functools import lru_cache
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 50
+
+ARG_1_AND_2_ARE_WORDS = 0x0001
+WE_HAVE_A_SCALE = 0x0008
+MORE_COMPONENTS = 0x0020
+WE_HAVE_AN_X_AND_Y_SCALE = 0x0040
+WE_HAVE_A_TWO_BY_TWO = 0x0080
+
+SUBSET_TABLES = (
+    b'cvt ', b'fpgm', b'glyf', b'head', b'hhea', b'hmtx', b'loca', b'maxp',
+    b'prep',
+)
+
+
+def checksum(data):
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}L', data)) & 0xFFFFFFFF
+
+
+class TrueTypeFont:
+    """метрики, таблица символов и подмножества TrueType-шрифта."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.data = file.read()
+        count, = struct.unpack_from('>H', self.data, 4)
+        self.tables = {}
+        for number in range(count):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sLLL', self.data, 12 + 16 * number)
+            self.tables[tag] = (offset, length)
+        head = self.table(b'head')
+        self.units, = struct.unpack_from('>H', head, 18)
+        self.bbox = struct.unpack_from('>4h', head, 36)
+        self.long_loca, = struct.unpack_from('>h', head, 50)
+        hhea = self.table(b'hhea')
+        self.ascent, self.descent = struct.unpack_from('>2h', hhea, 4)
+        metrics, = struct.unpack_from('>H', hhea, 34)
+        self.glyph_count, = struct.unpack_from('>H', self.table(b'maxp'), 4)
+        hmtx = self.table(b'hmtx')
+        self.advances = [
+            struct.unpack_from('>H', hmtx, 4 * number)[0]
+            for number in range(metrics)
+        ]
+        self.cmap = self.read_cmap()
+        self.char_widths = {}
+
+    def table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    def read_cmap(self):
+        """таблица Unicode -> глиф из подтаблицы формата 4 (3, 1)."""
+        cmap = self.table(b'cmap')
+        count, = struct.unpack_from('>H', cmap, 2)
+        for number in range(count):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHL', cmap, 4 + 8 * number)
+            if (platform, encoding) == (3, 1):
+                return self.read_format4(cmap, offset)
+        raise ValueError('В шрифте нет таблицы символов Unicode.')
+
+    def read_format4(self, cmap, offset):
+        segments = struct.unpack_from('>H', cmap, offset + 6)[0] // 2
+        ends = struct.unpack_from(f'>{segments}H', cmap, offset + 14)
+        starts_at = offset + 16 + 2 * segments
+        starts = struct.unpack_from(f'>{segments}H', cmap, starts_at)
+        deltas = struct.unpack_from(
+            f'>{segments}h', cmap, starts_at + 2 * segments)
+        ranges_at = starts_at + 4 * segments
+        ranges = struct.unpack_from(f'>{segments}H', cmap, ranges_at)
+        mapping = {}
+        for number in range(segments):
+            for code in range(starts[number], ends[number] + 1):
+                if ranges[number] == 0:
+                    glyph = (code + deltas[number]) & 0xFFFF
+                else:
+                    at = (ranges_at + 2 * number + ranges[number]
+                          + 2 * (code - starts[number]))
+                    glyph, = struct.unpack_from('>H', cmap, at)
+                    if glyph:
+                        glyph = (glyph + deltas[number]) & 0xFFFF
+                if glyph:
+                    mapping[code] = glyph
+        return mapping
+
+    def glyph(self, char):
+        return self.cmap.get(ord(char), 0)
+
+    def text_width(self, text):
+        """ширина строки в тысячных долях кегля."""
+        widths = self.char_widths
+        total = 0
+        for char in text:
+            width = widths.get(char)
+            if width is None:
+                width = widths[char] = self.width(self.glyph(char))
+            total += width
+        return total
+
+    def width(self, glyph):
+        """ширина глифа в тысячных долях кегля."""
+        advance = self.advances[min(glyph, len(self.advances) - 1)]
+        return advance * 1000 // self.units
+
+    def glyph_location(self, loca, glyph):
+        if self.long_loca:
+            return struct.unpack_from('>2L', loca, 4 * glyph)
+        start, end = struct.unpack_from('>2H', loca, 2 * glyph)
+        return start * 2, end * 2
+
+    def components(self, data):
+        """глифы, из которых собран составной глиф."""
+        if len(data) < 10 or struct.unpack_from('>h', data)[0] >= 0:
+            return
+        offset = 10
+        flags = MORE_COMPONENTS
+        while flags & MORE_COMPONENTS:
+            flags, glyph = struct.unpack_from('>HH', data, offset)
+            yield glyph
+            offset += 4 + (4 if flags & ARG_1_AND_2_ARE_WORDS else 2)
+            if flags & WE_HAVE_A_SCALE:
+                offset += 2
+            elif flags & WE_HAVE_AN_X_AND_Y_SCALE:
+                offset += 4
+            elif flags & WE_HAVE_A_TWO_BY_TWO:
+                offset += 8
+
+    def subset(self, glyphs):
+        """шрифт, в котором остались только контуры glyphs.
+
+        Номера глифов не меняются, контуры остальных становятся пустыми.
+        """
+        loca, glyf = self.table(b'loca'), self.table(b'glyf')
+        pending, keep = set(glyphs) | {0}, set()
+        while pending:
+            glyph = pending.pop()
+            if glyph in keep or glyph >= self.glyph_count:
+                continue
+            keep.add(glyph)
+            start, end = self.glyph_location(loca, glyph)
+            pending.update(self.components(glyf[start:end]))
+        new_glyf, offsets = bytearray(), []
+        for glyph in range(self.glyph_count):
+            offsets.append(len(new_glyf))
+            if glyph in keep:
+                start, end = self.glyph_location(loca, glyph)
+                new_glyf += glyf[start:end]
+                new_glyf += b'\0' * (-len(new_glyf) % 4)
+        offsets.append(len(new_glyf))
+        head = bytearray(self.table(b'head'))
+        struct.pack_into('>L', head, 8, 0)
+        struct.pack_into('>h', head, 50, 1)
+        tables = {
+            tag: self.table(tag) for tag in SUBSET_TABLES
+            if tag in self.tables
+        }
+        tables[b'head'] = bytes(head)
+        tables[b'glyf'] = bytes(new_glyf)
+        tables[b'loca'] = struct.pack(f'>{len(offsets)}L', *offsets)
+        return self.build(tables)
+
+    @staticmethod
+    def build(tables):
+        count = len(tables)
+        power = 1 << (count.bit_length() - 1)
+        header = struct.pack(
+            '>LHHHH', 0x00010000, count, power * 16,
+            power.bit_length() - 1, count * 16 - power * 16)
+        directory, body = b'', b''
+        offset = 12 + 16 * count
+        for tag in sorted(tables):
+            data = tables[tag]
+            directory += struct.pack(
+                '>4sLLL', tag, checksum(data), offset + len(body), len(data))
+            body += data + b'\0' * (-len(data) % 4)
+        font = bytearray(header + directory + body)
+        head_at = font.find(b'head', 12, 12 + 16 * count)
+        head_offset, = struct.unpack_from('>L', font, head_at + 8)
+        struct.pack_into(
+            '>L', font, head_offset + 8,
+            (0xB1B0AFBA - checksum(bytes(font))) & 0xFFFFFFFF)
+        return bytes(font)
+
+
+@lru_cache(maxsize=4)
+def load_font(path):
+    return TrueTypeFont(path)
+
+
+class PdfWriter:
+    """пишет PDF по страницам: номера объектов шрифта заняты заранее."""
+    (catalog_id, pages_id, font_id, cid_font_id, descriptor_id, font_file_id,
+     to_unicode_id) = range(1, 8)
+
+    def __init__(self, font, font_name='DejaVuSans'):
+        self.font = font
+        self.font_name = font_name
+        self.offset = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = self.to_unicode_id + 1
+        self.used = {}
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.offset
+        chunk = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        self.offset += len(chunk)
+        return chunk
+
+    def write_stream(self, number, data, extra=b''):
+        data = zlib.compress(data)
+        return self.write_object(number, b'<< /Length %d /Filter '
+                                 b'/FlateDecode %s>>\nstream\n%s\nendstream'
+                                 % (len(data), extra, data))
+
+    def start(self):
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self.offset = len(header)
+        return header
+
+    def encode(self, text):
+        glyphs = []
+        for char in text:
+            glyph = self.font.glyph(char)
+            self.used[glyph] = char
+            glyphs.append(glyph)
+        return b'<%s>' % ''.join(f'{glyph:04X}' for glyph in glyphs).encode()
+
+    def page(self, lines):
+        """страница из строк (текст, кегль) сверху вниз."""
+        content = [b'BT']
+        y = PAGE_HEIGHT - MARGIN
+        for text, size in lines:
+            y -= size * 1.4
+            content.append(b'/F1 %d Tf 1 0 0 1 %d %.1f Tm %s Tj' % (
+                size, MARGIN, y, self.encode(text)))
+        content.append(b'ET')
+        page_id, content_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.page_ids.append(page_id)
+        return self.write_object(page_id, (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] '
+            b'/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>'
+            % (self.pages_id, PAGE_WIDTH, PAGE_HEIGHT, self.font_id,
+               content_id)
+        )) + self.write_stream(content_id, b'\n'.join(content))
+
+    def finish(self):
+        """шрифт, дерево страниц, каталог и таблица xref."""
+        yield self.write_object(self.pages_id, b'<< /Type /Pages /Kids [%s] '
+                                b'/Count %d >>' % (b' '.join(
+                                    b'%d 0 R' % page
+                                    for page in self.page_ids),
+                                    len(self.page_ids)))
+        yield self.write_object(self.catalog_id, b'<< /Type /Catalog '
+                                b'/Pages %d 0 R >>' % self.pages_id)
+        yield from self.write_font()
+        xref = self.offset
+        size = max(self.offsets) + 1
+        table = [b'xref\n0 %d\n0000000000 65535 f \n' % size]
+        for number in range(1, size):
+            table.append(b'%010d 00000 n \n' % self.offsets.get(number, 0))
+        table.append(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n'
+                     b'%d\n%%%%EOF\n' % (size, self.catalog_id, xref))
+        yield b''.join(table)
+
+    def write_font(self):
+        font, name = self.font, b'AAAAAA+' + self.font_name.encode()
+        scale = 1000 / font.units
+        widths = b' '.join(
+            b'%d [%d]' % (glyph, font.width(glyph))
+            for glyph in sorted(self.used))
+        yield self.write_object(self.font_id, (
+            b'<< /Type /Font /Subtype /Type0 /BaseFont /%s '
+            b'/Encoding /Identity-H /DescendantFonts [%d 0 R] '
+            b'/ToUnicode %d 0 R >>'
+            % (name, self.cid_font_id, self.to_unicode_id)))
+        yield self.write_object(self.cid_font_id, (
+            b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /%s '
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            b'/Supplement 0 >> /FontDescriptor %d 0 R /CIDToGIDMap /Identity '
+            b'/W [%s] >>' % (name, self.descriptor_id, widths)))
+        yield self.write_object(self.descriptor_id, (
+            b'<< /Type /FontDescriptor /FontName /%s /Flags 32 '
+            b'/FontBBox [%s] /ItalicAngle 0 /Ascent %d /Descent %d '
+            b'/CapHeight %d /StemV 80 /FontFile2 %d 0 R >>' % (
+                name,
+                b' '.join(b'%d' % (value * scale) for value in font.bbox),
+                font.ascent * scale, font.descent * scale,
+                font.ascent * scale, self.font_file_id)))
+        subset = font.subset(self.used)
+        yield self.write_stream(
+            self.font_file_id, subset, b'/Length1 %d ' % len(subset))
+        yield self.write_stream(self.to_unicode_id, self.to_unicode_cmap())
+
+    def to_unicode_cmap(self):
+        mapping = sorted(self.used.items())
+        lines = [
+            b'/CIDInit /ProcSet findresource begin 12 dict begin begincmap',
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+            b'/Supplement 0 >> def /CMapName /Adobe-Identity-UCS def '
+            b'/CMapType 2 def',
+            b'1 begincodespacerange <0000> <FFFF> endcodespacerange',
+        ]
+        for start in range(0, len(mapping), 100):
+            chunk = mapping[start:start + 100]
+            lines.append(b'%d beginbfchar' % len(chunk))
+            lines.extend(
+                b'<%04X> <%04X>' % (glyph, ord(char))
+                for glyph, char in chunk)
+            lines.append(b'endbfchar')
+        lines.append(b'endcmap CMapName currentdict /CMap defineresource '
+                     b'pop end end')
+        return b'\n'.join(lines)
+
+
+def wrap(font, text, size, width):
+    """разбивает строку по словам под ширину width."""
+    limit = width * 1000 / size
+    if font.text_width(text) <= limit:
+        yield text
+        return
+    space = font.text_width(' ')
+    line, used = [], 0
+    for word in text.split(' '):
+        word_width = font.text_width(word)
+        if line and used + space + word_width > limit:
+            yield ' '.join(line)
+            line, used = [], 0
+        used += word_width + (space if line else 0)
+        line.append(word)
+    yield ' '.join(line)
+
+
+def render_pdf(title, lines, font_path, size=11):
+    """PDF с заголовком и строками, выдаётся частями по страницам."""
+    font = load_font(font_path)
+    writer = PdfWriter(font)
+    yield writer.start()
+    width = PAGE_WIDTH - 2 * MARGIN
+    bottom = MARGIN + size * 1.4
+    page, y = [(title, 16)], PAGE_HEIGHT - MARGIN - 16 * 1.4
+    for text in lines:
+        for part in wrap(font, text, size, width):
+            y -= size * 1.4
+            if y < bottom:
+                yield writer.page(page)
+                page, y = [], PAGE_HEIGHT - MARGIN - size * 1.4
+            page.append((part, size))
+    yield writer.page(page)
+    yield from writer.finish()
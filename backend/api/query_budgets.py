@@ -0,0 +1,62 @@
+"""потолки числа SQL-запросов для сценариев из api.scenarios.
+
+api/tests/test_query_budgets.py прогоняет каждый сценарий на малом
+и большом наборе данных, а списки - ещё и со страницами разного размера. Запросов не
+должно быть больше потолка, и их число не должно расти вместе с данными
+или страницей: рост означает запрос на каждую строку ответа.
+Запросы считаются при пустом кэше фрагментов и флагов пользователя.
+"""
+
+PAGE_SIZES = (6, 60)
+
+DATASETS = (
+    ('малый', {'users': 12, 'recipes': 12}),
+    ('большой', {'users': 80, 'recipes': 150}),
+)
+
+# сценарий: (потолок, постраничный список)
+QUERY_BUDGETS = {
+    'recipes_anon': (5, True),
+    'recipes_auth': (8, True),
+    'recipes_page_60': (8, False),
+    'recipes_tags': (10, True),
+    'recipes_author': (10, True),
+    'recipes_favorited': (8, True),
+    'recipes_in_cart': (8, True),
+    'recipes_search': (8, True),
+    'recipe_detail_anon': (4, False),
+    'recipe_detail_auth': (7, False),
+    # на Postgres ещё блокировка имени файла изображения
+    'recipe_create_json': (14, False),
+    'recipe_create_multipart': (14, False),
+    'recipe_update': (20, False),
+    # каскад читает строки ингредиентов, избранного и корзин для сигналов
+    'recipe_delete': (19, False),
+    'ingredients_search': (1, False),
+    'ingredients_fuzzy': (1, False),
+    'ingredient_detail': (1, False),
+    'tags': (1, False),
+    'tag_detail': (1, False),
+    'users': (2, False),
+    'user_detail': (2, False),
+    'users_me': (1, False),
+    'subscriptions': (4, True),
+    'subscribe': (6, False),
+    'subscribe_bulk': (7, False),
+    'unsubscribe': (5, False),
+    'unsubscribe_bulk': (8, False),
+    'favorite': (5, False),
+    'favorite_bulk': (7, False),
+    'unfavorite': (5, False),
+    'unfavorite_bulk': (8, False),
+    'shopping_cart': (9, False),
+    'shopping_cart_bulk': (11, False),
+    'shopping_cart_remove': (9, False),
+    'shopping_cart_remove_bulk': (12, False),
+    'download_txt': (1, False),
+    'download_pdf': (1, False),
+    'user_create': (5, False),
+    'set_password': (2, False),
+    'token_login': (6, False),
+    'token_logout': (1, False),
+}
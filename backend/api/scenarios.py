@@ -0,0 +1,258 @@
+import base64
+import json
+import time
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingList, Tag
+from users.models import Followers, User
+
+PASSWORD = 'Bench-password-1'
+
+
+class ScenarioError(Exception):
+    pass
+
+
+def image_bytes(size=(320, 240)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def case(name, method, path, user=None, data=None, format='json',
+         rollback=False, status=200, setup=None):
+    """запрос сценария; data может быть функцией, если нужен свежий объект.
+
+    user - 'user' (владелец корзины и подписок), 'author' (автор рецепта)
+    или None для анонима. Сценарии с rollback выполняются в транзакции,
+    которая откатывается, и не меняют данные. setup готовит данные перед
+    запросом, его SQL в замер не входит.
+    """
+    return {
+        'name': name, 'method': method, 'path': path, 'user': user,
+        'data': data, 'format': format, 'rollback': rollback,
+        'status': status, 'setup': setup,
+    }
+
+
+class Scenarios:
+    """запросы ко всем маршрутам API на данных из текущей базы.
+
+    Общие для замера скорости (benchmark_api) и проверки числа
+    запросов (api/tests/test_query_budgets.py). Не входят только
+    маршруты djoser с письмами: активация, сброс пароля и email.
+    """
+
+    def __init__(self):
+        self.fixtures = self.load_fixtures()
+
+    def load_fixtures(self):
+        """пользователь с корзиной, рецепт из корзин с автором, теги."""
+        cart = ShoppingList.objects.order_by('pk').first()
+        if cart is None:
+            raise ScenarioError(
+                'В базе нет корзин: сначала запустите generate_fake_data.')
+        user = cart.user
+        recipe = Recipe.objects.filter(
+            shopping_cart__isnull=False).order_by(
+                '-pub_date', '-id').select_related('author').first()
+        return {
+            'user': user,
+            'author': recipe.author,
+            'recipe': recipe,
+            'popular_author': User.objects.order_by('-recipes_count').first(),
+            'other_recipe': Recipe.objects.exclude(
+                favorite__user=user).exclude(
+                    shopping_cart__user=user).order_by('pk').first(),
+            'other_author': User.objects.exclude(pk=user.pk).exclude(
+                following__user=user).order_by('pk').first(),
+            'tags': list(Tag.objects.order_by('pk').values_list(
+                'slug', flat=True)[:2]),
+            'tag': Tag.objects.order_by('pk').first(),
+            'ingredients': list(Ingredient.objects.order_by(
+                'pk').values_list('pk', flat=True)[:10]),
+            'image': image_bytes(),
+        }
+
+    def recipe_data(self):
+        fixtures = self.fixtures
+        return {
+            'name': 'Замер',
+            'text': 'Рецепт для замера.',
+            'cooking_time': 15,
+            'tags': [Tag.objects.get(slug=slug).pk
+                     for slug in fixtures['tags']],
+            'ingredients': [
+                {'id': pk, 'amount': 10 + number}
+                for number, pk in enumerate(fixtures['ingredients'])],
+        }
+
+    def link(self, model, **fields):
+        """связь пользователя, которую сценарий удаления удалит."""
+        return lambda: model.objects.create(
+            user=self.fixtures['user'], **fields)
+
+    def set_password(self):
+        """известный пароль пользователя для входа и смены пароля."""
+        user = self.fixtures['user']
+        user.set_password(PASSWORD)
+        User.objects.filter(pk=user.pk).update(password=user.password)
+
+    def new_cart_version(self):
+        """новая версия корзины: список строится заново, а не из кэша."""
+        user = self.fixtures['user']
+        User.objects.filter(pk=user.pk).shift('cart_version')
+        user.refresh_from_db(fields=['cart_version'])
+
+    def cases(self):
+        fixtures = self.fixtures
+        recipe = fixtures['recipe'].pk
+        other_recipe = fixtures['other_recipe'].pk
+        other_author = fixtures['other_author'].pk
+        favorite = self.link(Favorite, recipe_id=other_recipe)
+        cart = self.link(ShoppingList, recipe_id=other_recipe)
+        follow = self.link(Followers, author_id=other_author)
+        tags = '&'.join(f'tags={slug}' for slug in fixtures['tags'])
+        data = self.recipe_data()
+        image = fixtures['image']
+        json_recipe = dict(
+            data, image='data:image/png;base64,'
+            + base64.b64encode(image).decode())
+
+        def multipart_recipe():
+            return dict(
+                data,
+                tags=[str(pk) for pk in data['tags']],
+                ingredients=json.dumps(data['ingredients']),
+                image=SimpleUploadedFile('bench.png', image, 'image/png'))
+
+        return [
+            case('recipes_anon', 'get', '/api/recipes/'),
+            case('recipes_auth', 'get', '/api/recipes/', 'user'),
+            case('recipes_page_60', 'get', '/api/recipes/?limit=60', 'user'),
+            case('recipes_tags', 'get', f'/api/recipes/?{tags}', 'user'),
+            case('recipes_author', 'get',
+                 f'/api/recipes/?author={fixtures["popular_author"].pk}',
+                 'user'),
+            case('recipes_favorited', 'get',
+                 '/api/recipes/?is_favorited=1', 'user'),
+            case('recipes_in_cart', 'get',
+                 '/api/recipes/?is_in_shopping_cart=1', 'user'),
+            case('recipes_search', 'get', '/api/recipes/?search=суп',
+                 'user'),
+            case('recipe_detail_anon', 'get', f'/api/recipes/{recipe}/'),
+            case('recipe_detail_auth', 'get', f'/api/recipes/{recipe}/',
+                 'user'),
+            case('recipe_create_json', 'post', '/api/recipes/', 'user',
+                 json_recipe, rollback=True, status=201),
+            case('recipe_create_multipart', 'post', '/api/recipes/', 'user',
+                 multipart_recipe, 'multipart', rollback=True, status=201),
+            case('recipe_update', 'patch', f'/api/recipes/{recipe}/',
+                 'author', {'name': 'Замер', 'ingredients': data[
+                     'ingredients']}, rollback=True),
+            case('recipe_delete', 'delete', f'/api/recipes/{recipe}/',
+                 'author', rollback=True, status=204),
+            case('ingredients_search', 'get', '/api/ingredients/?name=мук'),
+            case('ingredients_fuzzy', 'get', '/api/ingredients/?name=мкуа'),
+            case('ingredient_detail', 'get',
+                 f'/api/ingredients/{fixtures["ingredients"][0]}/'),
+            case('tags', 'get', '/api/tags/'),
+            case('tag_detail', 'get', f'/api/tags/{fixtures["tag"].pk}/'),
+            case('users', 'get', '/api/users/', 'user'),
+            case('user_detail', 'get',
+                 f'/api/users/{fixtures["popular_author"].pk}/', 'user'),
+            case('users_me', 'get', '/api/users/me/', 'user'),
+            case('subscriptions', 'get',
+                 '/api/users/subscriptions/?recipes_limit=3', 'user'),
+            case('subscribe', 'post', f'/api/users/{other_author}/subscribe/',
+                 'user', rollback=True, status=201),
+            case('subscribe_bulk', 'post', '/api/users/subscribe/', 'user',
+                 {'ids': [other_author]}, rollback=True),
+            case('unsubscribe', 'delete',
+                 f'/api/users/{other_author}/subscribe/', 'user',
+                 rollback=True, status=204, setup=follow),
+            case('unsubscribe_bulk', 'delete', '/api/users/subscribe/',
+                 'user', {'ids': [other_author]}, rollback=True,
+                 setup=follow),
+            case('favorite', 'post', f'/api/recipes/{other_recipe}/favorite/',
+                 'user', rollback=True, status=201),
+            case('favorite_bulk', 'post', '/api/recipes/favorite/', 'user',
+                 {'ids': [other_recipe]}, rollback=True),
+            case('unfavorite', 'delete',
+                 f'/api/recipes/{other_recipe}/favorite/', 'user',
+                 rollback=True, status=204, setup=favorite),
+            case('unfavorite_bulk', 'delete', '/api/recipes/favorite/',
+                 'user', {'ids': [other_recipe]}, rollback=True,
+                 setup=favorite),
+            case('shopping_cart', 'post',
+                 f'/api/recipes/{other_recipe}/shopping_cart/', 'user',
+                 rollback=True, status=201),
+            case('shopping_cart_bulk', 'post', '/api/recipes/shopping_cart/',
+                 'user', {'ids': [other_recipe]}, rollback=True),
+            case('shopping_cart_remove', 'delete',
+                 f'/api/recipes/{other_recipe}/shopping_cart/', 'user',
+                 rollback=True, status=204, setup=cart),
+            case('shopping_cart_remove_bulk', 'delete',
+                 '/api/recipes/shopping_cart/', 'user',
+                 {'ids': [other_recipe]}, rollback=True, setup=cart),
+            case('download_txt', 'get',
+                 '/api/recipes/download_shopping_cart/', 'user',
+                 setup=self.new_cart_version),
+            case('download_pdf', 'get',
+                 '/api/recipes/download_shopping_cart/?format=pdf', 'user',
+                 setup=self.new_cart_version),
+            case('user_create', 'post', '/api/users/', None, {
+                'email': 'bench@example.com', 'username': 'bench',
+                'first_name': 'Замер', 'last_name': 'Замеров',
+                'password': PASSWORD}, rollback=True, status=201),
+            case('set_password', 'post', '/api/users/set_password/', 'user',
+                 {'current_password': PASSWORD,
+                  'new_password': 'Bench-password-2'},
+                 rollback=True, status=204, setup=self.set_password),
+            case('token_login', 'post', '/api/auth/token/login/', None,
+                 {'email': fixtures['user'].email, 'password': PASSWORD},
+                 rollback=True, setup=self.set_password),
+            case('token_logout', 'post', '/api/auth/token/logout/', 'user',
+                 rollback=True, status=204),
+        ]
+
+    def request(self, scenario):
+        """один запрос: время до последнего байта, SQL-запросы, байты."""
+        client = APIClient()
+        if scenario['user']:
+            client.force_authenticate(self.fixtures[scenario['user']])
+        if scenario['setup']:
+            scenario['setup']()
+        data = scenario['data']
+        if callable(data):
+            data = data()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, scenario['method'])(
+                scenario['path'], data, format=scenario['format'])
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            elapsed = (time.perf_counter() - started) * 1000
+        response.close()
+        if response.status_code != scenario['status']:
+            raise ScenarioError(
+                f'{scenario["name"]}: ответ {response.status_code}, '
+                f'ожидался {scenario["status"]}')
+        return elapsed, queries.captured_queries, size
+
+    def run(self, scenario):
+        """request, для сценариев с rollback - в откатываемой транзакции."""
+        if not scenario['rollback']:
+            return self.request(scenario)
+        with transaction.atomic():
+            sample = self.request(scenario)
+            transaction.set_rollback(True)
+        return sample
@@ -0,0 +1,251 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.db import DatabaseError
+
+from recipes.models import Ingredient
+from .versions import get_versions
+
+logger = logging.getLogger(__name__)
+
+INGREDIENTS = 'recipes.ingredient'
+
+
+def normalize(text):
+    return text.strip().lower().replace('ё', 'е')
+
+
+VOWELS = str.maketrans('оея', 'аии')
+
+
+def fold(text):
+    """сводит безударные гласные: малако и молоко дают одну строку."""
+    return text.translate(VOWELS)
+
+
+def ngrams(text, size):
+    """все подстроки text длиной от 1 до size."""
+    return {
+        text[start:start + length]
+        for length in range(1, size + 1)
+        for start in range(len(text) - length + 1)
+    }
+
+
+def bounded_levenshtein(first, second, limit, prefix=False):
+    """расстояние Левенштейна или limit + 1, если оно больше limit.
+
+    Считаются только клетки в полосе шириной limit от диагонали.
+    С prefix=True first сравнивается с ближайшим началом second.
+    """
+    if not prefix and abs(len(first) - len(second)) > limit:
+        return limit + 1
+    over = limit + 1
+    width = len(second)
+    previous = [min(column, over) for column in range(width + 1)]
+    for row, char in enumerate(first, 1):
+        low, high = max(1, row - limit), min(width, row + limit)
+        current = [over] * (width + 1)
+        current[0] = min(row, over)
+        for column in range(low, high + 1):
+            cost = previous[column - 1] + (char != second[column - 1])
+            if previous[column] < cost:
+                cost = previous[column] + 1
+            if current[column - 1] < cost:
+                cost = current[column - 1] + 1
+            current[column] = cost if cost < over else over
+        if min(current[low - 1:high + 1]) > limit:
+            return over
+        previous = current
+    return min(previous) if prefix else previous[width]
+
+
+def edit_limit(query):
+    """допустимое число опечаток растёт с длиной запроса."""
+    if len(query) <= 4:
+        return 1
+    if len(query) <= 8:
+        return 2
+    return 3
+
+
+class IngredientIndex:
+    """индекс ингредиентов в памяти процесса.
+
+    Отсортированный список названий отвечает на поиск по началу строки
+    бинарным поиском, n-граммы - на поиск подстроки пересечением списков.
+    """
+    ngram_size = 3
+    fuzzy_min_length = 3
+    fuzzy_candidates = 100
+    fuzzy_limit = 20
+    fuzzy_budget = 0.02
+
+    def __init__(self, ingredients):
+        self.items = sorted(
+            ingredients, key=lambda item: (normalize(item['name']), item['id']))
+        self.keys = [normalize(item['name']) for item in self.items]
+        self.by_id = {item['id']: item for item in self.items}
+        self.postings = defaultdict(list)
+        for position, key in enumerate(self.keys):
+            for gram in ngrams(key, self.ngram_size):
+                self.postings[gram].append(position)
+        self.folded = [fold(key) for key in self.keys]
+        self.folded_postings = defaultdict(list)
+        for position, key in enumerate(self.folded):
+            for gram in ngrams(key, self.ngram_size):
+                self.folded_postings[gram].append(position)
+
+    def get(self, pk):
+        return self.by_id.get(pk)
+
+    def all(self):
+        return self.items
+
+    def prefix_positions(self, query):
+        positions = []
+        position = bisect_left(self.keys, query)
+        while position < len(self.keys) and self.keys[position].startswith(
+                query):
+            positions.append(position)
+            position += 1
+        return positions
+
+    def substring_positions(self, query):
+        if len(query) <= self.ngram_size:
+            return self.postings.get(query, [])
+        grams = sorted(
+            (self.postings.get(query[start:start + self.ngram_size], [])
+             for start in range(len(query) - self.ngram_size + 1)),
+            key=len)
+        candidates = set(grams[0])
+        for postings in grams[1:]:
+            candidates.intersection_update(postings)
+            if not candidates:
+                return []
+        return sorted(
+            position for position in candidates
+            if query in self.keys[position])
+
+    def search(self, query, fuzzy=None):
+        """сначала совпадения с начала названия, затем по подстроке.
+
+        fuzzy=True ищет только с опечатками, fuzzy=False - только точно,
+        None - с опечатками, если точных совпадений нет.
+        """
+        query = normalize(query)
+        if not query:
+            return self.items
+        if fuzzy:
+            return self.fuzzy_search(query)
+        prefix = self.prefix_positions(query)
+        seen = set(prefix)
+        substring = [
+            position for position in self.substring_positions(query)
+            if position not in seen
+        ]
+        if prefix or substring or fuzzy is not None:
+            return [self.items[position] for position in prefix + substring]
+        return self.fuzzy_search(query)
+
+    def fuzzy_candidates_for(self, query, limit):
+        """позиции названий с наибольшим числом общих n-грамм.
+
+        query и названия сравниваются после fold().
+
+        Строка в пределах limit правок делит с запросом не меньше
+        len(query) - size + 1 - limit * size n-грамм длины size,
+        остальные отбрасываются без подсчёта расстояния.
+        """
+        size = 2 if len(query) < 5 else self.ngram_size
+        shared = Counter()
+        for start in range(len(query) - size + 1):
+            shared.update(
+                self.folded_postings.get(query[start:start + size], ()))
+        required = len(query) - size + 1 - limit * size
+        return [
+            position for position, count in
+            shared.most_common(self.fuzzy_candidates)
+            if count >= required
+        ]
+
+    def fuzzy_distance(self, query, key, limit):
+        """расстояние до начала названия или до начала одного из слов."""
+        length = len(query) + limit
+        best = bounded_levenshtein(query, key[:length], limit, prefix=True)
+        for word in key.split()[1:]:
+            if best == 0:
+                break
+            best = min(best, bounded_levenshtein(
+                query, word[:length], best, prefix=True))
+        return best
+
+    def fuzzy_search(self, query):
+        """поиск с опечатками в пределах бюджета времени fuzzy_budget.
+
+        Порядок: число правок без учёта безударных гласных, затем с их
+        учётом, затем близость длины названия к запросу.
+        """
+        if len(query) < self.fuzzy_min_length:
+            return []
+        limit = edit_limit(query)
+        folded = fold(query)
+        deadline = time.monotonic() + self.fuzzy_budget
+        scored = []
+        for position in self.fuzzy_candidates_for(folded, limit):
+            if time.monotonic() > deadline:
+                break
+            distance = self.fuzzy_distance(
+                folded, self.folded[position], limit)
+            if distance > limit:
+                continue
+            key = self.keys[position]
+            scored.append((
+                distance,
+                self.fuzzy_distance(query, key, limit),
+                abs(len(key) - len(query)),
+                key,
+                position,
+            ))
+        scored.sort()
+        return [
+            self.items[position]
+            for *_, position in scored[:self.fuzzy_limit]
+        ]
+
+
+class IngredientSearch:
+    """держит индекс процесса в актуальном состоянии.
+
+    Перед каждым поиском сверяет версию справочника ингредиентов в кэше
+    и перестраивает индекс, если справочник изменился.
+    """
+
+    def __init__(self):
+        self._index = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get_index(self):
+        version, = get_versions(INGREDIENTS)
+        if self._index is None or self._version != version:
+            with self._lock:
+                if self._index is None or self._version != version:
+                    self._index = IngredientIndex(
+                        Ingredient.objects.values(
+                            'id', 'name', 'measurement_unit').iterator())
+                    self._version = version
+        return self._index
+
+    def warm(self):
+        """строит индекс при старте процесса, если база уже доступна."""
+        try:
+            self.get_index()
+        except DatabaseError:
+            logger.warning('Индекс ингредиентов будет построен позже.')
+
+
+ingredient_search = IngredientSearch()
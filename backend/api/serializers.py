@@ -1,14 +1,23 @@
+import json
+
 from drf_extra_fields.fields import Base64ImageField
-from django.db.models import F
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.http import QueryDict
 from rest_framework import serializers
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from rest_framework.serializers import (ModelSerializer,
-                                        UniqueTogetherValidator)
+from rest_framework.serializers import UniqueTogetherValidator
 from rest_framework.fields import SerializerMethodField
-from recipes.models import (Ingredient, Recipe, Favorite, TagRecipe,
-                            Tag, RecipeIngredient, ShoppingList)
-from users.models import User, Followers
+from recipes.images import release_image, variant_names
+from recipes.models import (Ingredient, Recipe, Tag, RecipeIngredient,
+                            ShoppingCartIngredient, ShoppingList)
+from users.models import User
+from .fragments import get_fragments
+from .loaders import ViewerState, ViewerStateListSerializer
+from .signals import denormalized_by_caller
+from .versions import RECIPES, bump_version
 
 
 class UsersCreateSerializer(UserCreateSerializer):
@@ -45,14 +54,14 @@ class UsersSerializer(UserSerializer):
             'last_name',
             'is_subscribed'
         )
+        list_serializer_class = ViewerStateListSerializer
 
     def get_is_subscribed(self, obj: User):
         """получаем подписки на автора."""
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Followers.objects.filter(
-            user=request.user, author=obj).exists()
+        return ViewerState.from_context(self.context).is_subscribed(obj.id)
+
+    def prime_viewer_state(self, state, users):
+        state.prime_users(users)
 
 
 class FollowerSerializer(serializers.ModelSerializer):
@@ -75,59 +84,51 @@ class FollowerSerializer(serializers.ModelSerializer):
             'recipes',
             'recipes_count'
         )
+        list_serializer_class = ViewerStateListSerializer
 
     def get_is_subscribed(self, obj):
         """получаем подписки на автора."""
+        return ViewerState.from_context(self.context).is_subscribed(obj.id)
+
+    def prime_viewer_state(self, state, users):
+        state.prime_users(users)
+        self.prime_recipes(users)
+
+    def prime_recipes(self, users):
+        """рецепты всех авторов страницы одним запросом."""
         request = self.context.get('request')
         if request.user.is_anonymous:
-            return False
-        return Followers.objects.filter(
-            user=request.user, author=obj).exists()
+            return
+        recipes = {user.id: [] for user in users}
+        for recipe in self.recipes_queryset(request).filter(
+                author__in=recipes):
+            recipes[recipe.author_id].append(recipe)
+        self.context['author_recipes'] = recipes
+
+    @staticmethod
+    def recipes_queryset(request):
+        """последние рецепты, не больше recipes_limit на автора."""
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        limit = request.query_params.get('recipes_limit')
+        if limit:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(author=OuterRef('author')).order_by(
+                    '-pub_date', '-id').values('pk')[:int(limit)]))
+        return recipes
 
     def get_recipes(self, obj):
         """получаем рецепты."""
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
-        recipes = Recipe.objects.filter(author=obj)
-        limit = request.query_params.get('recipes_limit')
-        if limit:
-            recipes = recipes[:int(limit)]
+        recipes = self.context.get('author_recipes', {}).get(obj.id)
+        if recipes is None:
+            recipes = self.recipes_queryset(request).filter(author=obj)
         return UserFavoriteSerializer(
             recipes, many=True, context={'request': request}).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
-
-
-class FollowUsersSerializer(ModelSerializer):
-    """отображает подписки."""
-    class Meta:
-        model = Followers
-        fields = ('user', 'author')
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Followers.objects.all(),
-                fields=('user', 'author'),
-            )
-        ]
-
-    def validate_data(self):
-        author = self.instance
-        user = self.context.get('request')
-        if Followers.objects.filter(author=author, user=user.user).exists():
-            raise UniqueTogetherValidator(
-                detail='Вы уже подписаны!',
-            )
-        if user == author:
-            raise UniqueTogetherValidator(
-                detail='Подписка на себя запрещена',
-            )
-
-    def to_representation(self, instance):
-        return UsersSerializer(instance.author, context={
-            'request': self.context.get('request')
-        }).data
+        return obj.recipes_count
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -187,66 +188,109 @@ class TagSerializer(serializers.ModelSerializer):
         )
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """ссылки на уменьшенные копии изображения в JPEG и WebP."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image'
+        super().__init__(**kwargs)
+
+    def to_representation(self, image):
+        if not image:
+            return None
+        request = self.context.get('request')
+        build = request.build_absolute_uri if request else str
+        return {
+            variant: {
+                image_format: build(image.storage.url(name))
+                for image_format, name in formats.items()
+            }
+            for variant, formats in variant_names(image.name).items()
+        }
+
+
+class RecipeImageField(Base64ImageField):
+    """изображение строкой base64 в JSON или файлом multipart-формы.
+
+    Файл формы Django пишет во временный файл, поэтому в памяти он
+    целиком не лежит. Размер проверяется до декодирования, число
+    пикселей - по заголовку изображения, без распаковки.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            self.check_size(data.size)
+            image = serializers.ImageField.to_internal_value(self, data)
+        else:
+            if isinstance(data, str):
+                self.check_size(len(data) * 3 // 4)
+            image = super().to_internal_value(data)
+        if image is None:
+            return None
+        if (image.image.format or '').lower() not in self.ALLOWED_TYPES:
+            raise serializers.ValidationError(self.INVALID_TYPE_MESSAGE)
+        width, height = image.image.size
+        if width * height > settings.RECIPE_IMAGE['MAX_PIXELS']:
+            raise serializers.ValidationError(
+                f'Изображение больше '
+                f'{settings.RECIPE_IMAGE["MAX_PIXELS"]} пикселей!')
+        return image
+
+    @staticmethod
+    def check_size(size):
+        if size > settings.RECIPE_IMAGE['MAX_SIZE']:
+            raise serializers.ValidationError(
+                f'Файл больше {settings.RECIPE_IMAGE["MAX_SIZE"]} байт!')
+
+
 class UserFavoriteSerializer(serializers.ModelSerializer):
     """отображение избранного."""
+    images = ImageVariantsField()
+
     class Meta:
         model = Recipe
         fields = (
             'id',
             'name',
             'image',
+            'images',
             'cooking_time'
         )
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    """для модели Избранного."""
-    class Meta:
-        model = Favorite
-        fields = '__all__'
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-            )
-        ]
-
-    def get_fav(self, request):
-        return Favorite.objects.filter(
-            user=request.user, recipe__id=id
-        ).exists()
+class BulkIdsSerializer(serializers.Serializer):
+    """список id для пакетных операций."""
+    max_ids = 100
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=max_ids
+    )
 
-    def to_representation(self, instance):
-        return UserFavoriteSerializer(instance.recipe, context={
-            'request': self.context.get('request')
-        }).data
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
 
 
-class ShoppingListSerializer(serializers.ModelSerializer):
-    """для модели Рецепта в корзине."""
+class RecipeAuthorSerializer(serializers.ModelSerializer):
+    """автор в общей для всех части рецепта."""
     class Meta:
-        model = ShoppingList
-        fields = ('user', 'recipe')
-
-    def get_is_list(self, request):
-        return ShoppingList.objects.filter(
-            user=request.user, recipe=request.recipe
-        ).exists()
-
-    def to_representation(self, instance):
-        return UserFavoriteSerializer(instance.recipe, context={
-            'request': self.context.get('request')
-        }).data
+        model = User
+        fields = (
+            'id',
+            'email',
+            'username',
+            'first_name',
+            'last_name'
+        )
 
 
-class RecipeSerializer(serializers.ModelSerializer):
-    """просмотр рецептов."""
+class RecipeFragmentSerializer(serializers.ModelSerializer):
+    """часть рецепта, одинаковая для всех пользователей."""
     tags = TagSerializer(many=True)
-    ingredients = serializers.SerializerMethodField(
-        method_name='get_ingredients')
-    author = UsersSerializer(required=True)
-    is_favorited = SerializerMethodField(method_name='get_favorited')
-    is_in_shopping_cart = SerializerMethodField(method_name='get_cart')
+    ingredients = IngredientRecipeSerializer(
+        source='recipeingredient_set', many=True, read_only=True)
+    author = RecipeAuthorSerializer()
+    images = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -254,46 +298,68 @@ class RecipeSerializer(serializers.ModelSerializer):
             'id',
             'tags',
             'image',
+            'images',
             'name',
             'text',
             'author',
             'ingredients',
-            'cooking_time',
+            'cooking_time'
+        )
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """отрисовывает страницу рецептов одним обращением к кэшу."""
+
+    def to_representation(self, data):
+        if hasattr(data, 'all'):
+            data = data.all()
+        return self.child.render(list(data))
+
+
+class RecipeSerializer(RecipeFragmentSerializer):
+    """просмотр рецептов."""
+    author = UsersSerializer(required=True)
+    is_favorited = SerializerMethodField(method_name='get_favorited')
+    is_in_shopping_cart = SerializerMethodField(method_name='get_cart')
+
+    class Meta(RecipeFragmentSerializer.Meta):
+        fields = RecipeFragmentSerializer.Meta.fields + (
             'is_favorited',
             'is_in_shopping_cart'
         )
+        list_serializer_class = RecipeListSerializer
 
-    def get_ingredients(self, obj):
-        ingredients = obj.ingredients.values(
-            'id', 'measurement_unit', 'name',
-            amount=F('recipeingredient__amount')
-        )
-        return ingredients
+    def to_representation(self, instance):
+        return self.render([instance])[0]
+
+    def render(self, recipes):
+        """кэшированные фрагменты и поверх них флаги пользователя."""
+        state = ViewerState.from_context(self.context)
+        state.prime_recipes(recipes)
+        fragment = RecipeFragmentSerializer(context=self.context)
+        data = get_fragments(
+            recipes, self.context.get('request'), fragment.to_representation)
+        for item, recipe in zip(data, recipes):
+            item['author']['is_subscribed'] = state.is_subscribed(
+                recipe.author_id)
+            item['is_favorited'] = self.get_favorited(recipe)
+            item['is_in_shopping_cart'] = self.get_cart(recipe)
+        return data
 
     def get_favorited(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return Favorite.objects.filter(
-            user=request.user, recipe_id=obj
-        ).exists()
+        return ViewerState.from_context(self.context).is_favorited(obj.id)
 
     def get_cart(self, obj):
-        request = self.context.get('request')
-        if request.user.is_anonymous:
-            return False
-        return ShoppingList.objects.filter(
-            user=request.user, recipe_id=obj
-        ).exists()
+        return ViewerState.from_context(
+            self.context).is_in_shopping_cart(obj.id)
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """изменение/создание рецепта."""
     ingredients = IngredientAddSerializer(many=True)
-    tags = serializers.PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                              many=True)
+    tags = serializers.ListField(child=serializers.IntegerField())
     author = UsersSerializer(read_only=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
@@ -308,60 +374,94 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'cooking_time'
         )
 
+    def to_internal_value(self, data):
+        if isinstance(data, QueryDict):
+            data = self.form_data(data)
+        return super().to_internal_value(data)
+
+    @staticmethod
+    def form_data(data):
+        """multipart-форма в том же виде, что и JSON.
+
+        Ингредиенты приходят строкой JSON, теги - строкой JSON
+        или повторяющимся полем.
+        """
+        result = data.dict()
+        for key in ('ingredients', 'tags'):
+            if key not in data:
+                continue
+            values = data.getlist(key)
+            if len(values) == 1:
+                try:
+                    parsed = json.loads(values[0])
+                except ValueError:
+                    parsed = None
+                if isinstance(parsed, list):
+                    values = parsed
+            result[key] = values
+        return result
+
     def validate(self, data):
-        ingredients = data["ingredients"]
-        ingredients_list = []
+        if 'ingredients' in data or not self.partial:
+            data['ingredients'] = self.validate_ingredients_list(
+                data.get('ingredients'))
+        return data
+
+    def validate_ingredients_list(self, ingredients):
+        """проверка состава одним запросом к справочнику ингредиентов."""
+        if not ingredients:
+            raise serializers.ValidationError(
+                'Нужен минимум 1 ингредиент в рецепте!')
         for ingredient in ingredients:
-            if not ingredients:
-                raise serializers.ValidationError(
-                    'Нужен минимум 1 ингредиент в рецепте!')
-            if int(ingredient.get('amount')) < 1:
+            if ingredient['amount'] < 1:
                 raise serializers.ValidationError(
                     'Количество ингредиента должно быть больше 0!')
-            if int(ingredient.get('amount')) > 1000:
+            if ingredient['amount'] > 1000:
                 raise serializers.ValidationError(
                     'Количество ингредиента не должно быть больше 1000!'
                 )
-            ingredient_id = ingredient['id']
-            if ingredient_id in ingredients_list:
-                raise serializers.ValidationError(
-                    'Ингредиент должен быть уникальным!'
-                )
-            ingredients_list.append(ingredient_id)
-        return data
+        ids = [ingredient['id'] for ingredient in ingredients]
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError(
+                'Ингредиент должен быть уникальным!'
+            )
+        found = Ingredient.objects.in_bulk(ids)
+        if len(found) != len(ids):
+            raise serializers.ValidationError('Ингредиент не найден!')
+        return [
+            {**ingredient, 'ingredient': found[ingredient['id']]}
+            for ingredient in ingredients
+        ]
 
     def validate_tags(self, tags):
-        """валидация тегов."""
+        """валидация тегов одним запросом."""
         if not tags:
             raise serializers.ValidationError(
                 'Нужно выбрать хотя бы один тег!')
-        tags_list = []
-        for tag in tags:
-            if tag not in Tag.objects.all():
-                raise serializers.ValidationError(
-                    'Тег не найден!'
-                )
-            if tag in tags_list:
-                raise serializers.ValidationError(
-                    'Теги должны быть уникальными!'
-                )
-            tags_list.append(tag)
-        return tags
+        if len(set(tags)) != len(tags):
+            raise serializers.ValidationError(
+                'Теги должны быть уникальными!'
+            )
+        found = Tag.objects.in_bulk(tags)
+        if len(found) != len(tags):
+            raise serializers.ValidationError(
+                'Тег не найден!'
+            )
+        return [found[pk] for pk in tags]
 
     def create_ingredients(self, ingredients, recipe):
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredient_id = get_object_or_404(
-                Ingredient,
-                pk=ingredient.get('id')
-            )
-            item = RecipeIngredient(
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
-                amount=ingredient.get('amount'),
-                ingredient=ingredient_id
+                ingredient=ingredient['ingredient'],
+                amount=ingredient['amount']
             )
-            ingredients_list.append(item)
-        RecipeIngredient.objects.bulk_create(ingredients_list)
+            for ingredient in ingredients
+        )
+
+    def create_tags(self, tags, recipe):
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag) for tag in tags)
 
     def validate_cooking_time(self, cooking_time):
         """валидация времени приготовления."""
@@ -376,28 +476,105 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 'Можно ввести только число!')
         return cooking_time
 
+    def search_document(self, validated_data, ingredients, instance=None):
+        """текст для полнотекстового поиска по рецепту."""
+        if ingredients is None:
+            names = instance.recipeingredient_set.values_list(
+                'ingredient__name', flat=True)
+        else:
+            names = [
+                ingredient['ingredient'].name for ingredient in ingredients]
+        return Recipe.make_search_document(
+            validated_data.get('name', getattr(instance, 'name', '')),
+            validated_data.get('text', getattr(instance, 'text', '')),
+            names
+        )
+
     def create(self, validated_data):
         """создание рецепта."""
         ingredients = validated_data.pop('ingredients')
         author = self.context.get('request').user
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(author=author, **validated_data)
-        recipe.tags.set(tags)
-        self.create_ingredients(ingredients, recipe)
+        validated_data['search_document'] = self.search_document(
+            validated_data, ingredients)
+        with transaction.atomic():
+            recipe = Recipe.objects.create(author=author, **validated_data)
+            self.create_tags(tags, recipe)
+            self.create_ingredients(ingredients, recipe)
+        bump_version(RECIPES)
         return recipe
 
+    def update_ingredients(self, instance, ingredients):
+        """меняет только добавленные, удалённые и изменённые строки.
+
+        Разница количеств переносится в суммы корзин, где лежит рецепт.
+        """
+        old = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=instance)
+        }
+        new = {ingredient['id']: ingredient for ingredient in ingredients}
+        deltas = {
+            pk: (
+                (new[pk]['amount'] if pk in new else 0)
+                - (old[pk].amount if pk in old else 0),
+                (pk in new) - (pk in old)
+            )
+            for pk in old.keys() | new.keys()
+        }
+        changed = []
+        for pk in old.keys() & new.keys():
+            if old[pk].amount != new[pk]['amount']:
+                old[pk].amount = new[pk]['amount']
+                changed.append(old[pk])
+        removed = [old[pk].pk for pk in old.keys() - new.keys()]
+        if removed:
+            with denormalized_by_caller():
+                RecipeIngredient.objects.filter(pk__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        self.create_ingredients(
+            [new[pk] for pk in new.keys() - old.keys()], instance)
+        if any(delta != (0, 0) for delta in deltas.values()):
+            ShoppingCartIngredient.objects.apply(
+                ShoppingList.objects.filter(
+                    recipe=instance).values_list('user_id', flat=True),
+                deltas
+            )
+
+    def update_tags(self, instance, tags):
+        through = Recipe.tags.through
+        old = set(through.objects.filter(
+            recipe=instance).values_list('tag_id', flat=True))
+        new = {tag.pk: tag for tag in tags}
+        if old - new.keys():
+            through.objects.filter(
+                recipe=instance, tag_id__in=old - new.keys()).delete()
+        self.create_tags(
+            [new[pk] for pk in new.keys() - old], instance)
+
     def update(self, instance, validated_data):
-        """редактирование рецепта."""
-        TagRecipe.objects.filter(recipe=instance).delete()
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        ingredients = validated_data.pop('ingredients')
-        self.create_ingredients(ingredients, instance)
-        tags = validated_data.pop('tags')
-        instance.tags.set(tags)
-        if validated_data.get('image'):
-            instance.image = validated_data.pop('image')
-        instance.save()
-        return super().update(instance, validated_data)
+        """редактирование рецепта по разнице с текущим состоянием."""
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if not validated_data.get('image', True):
+            validated_data.pop('image')
+        if ingredients is not None or validated_data.keys() & {'name', 'text'}:
+            validated_data['search_document'] = self.search_document(
+                validated_data, ingredients, instance)
+        old_image = instance.image.name
+        with transaction.atomic():
+            if ingredients is not None:
+                self.update_ingredients(instance, ingredients)
+            if tags is not None:
+                self.update_tags(instance, tags)
+            for field, value in validated_data.items():
+                setattr(instance, field, value)
+            instance.save(update_fields=[*validated_data, 'pub_date'])
+            if instance.image.name != old_image:
+                transaction.on_commit(lambda: release_image(old_image))
+        bump_version(RECIPES)
+        return instance
 
     def to_representation(self, instance):
         return RecipeSerializer(instance, context={
@@ -0,0 +1,263 @@
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from recipes.images import make_variants, release_image
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCartIngredient, ShoppingList, Tag)
+from users.models import Followers
+from .fragments import CATALOG
+from .search import INGREDIENTS
+from .versions import RECIPES, bump_version
+
+User = get_user_model()
+
+AUTHOR_FIELDS = ('username', 'first_name', 'last_name', 'email')
+
+# связь: (модель объекта, поле связи, счётчик объекта)
+LINKS = {
+    Favorite: (Recipe, 'recipe', 'favorites_count'),
+    ShoppingList: (Recipe, 'recipe', 'in_carts_count'),
+    Followers: (User, 'author', 'followers_count'),
+}
+
+# поля, от которых зависят счётчики и суммы корзин
+TRACKED_FIELDS = {
+    Favorite: ('user', 'recipe'),
+    ShoppingList: ('user', 'recipe'),
+    Followers: ('user', 'author'),
+    Recipe: ('author',),
+    RecipeIngredient: ('recipe', 'ingredient', 'amount'),
+}
+
+_state = threading.local()
+
+
+@contextmanager
+def denormalized_by_caller():
+    """внутри блока счётчики и суммы корзин сдвигает сам вызывающий код.
+
+    API и импорт меняют связи, рецепты и ингредиенты пачками и переносят
+    разницу одним обновлением; построчные сигналы при этом пропускаются.
+    """
+    depth = getattr(_state, 'depth', 0)
+    _state.depth = depth + 1
+    try:
+        yield
+    finally:
+        _state.depth = depth
+
+
+def caller_denormalizes():
+    return getattr(_state, 'depth', 0) > 0
+
+
+def deleting_recipes():
+    """рецепты, удаляемые сейчас: их строки уходят каскадом."""
+    if not hasattr(_state, 'deleting'):
+        _state.deleting = set()
+    return _state.deleting
+
+
+def apply_to_carts(removed=(), added=()):
+    """переносит строки (рецепт, ингредиент, количество) в суммы корзин."""
+    by_recipe = defaultdict(lambda: defaultdict(lambda: [0, 0]))
+    for sign, rows in ((-1, removed), (1, added)):
+        for recipe_id, ingredient_id, amount in rows:
+            delta = by_recipe[recipe_id][ingredient_id]
+            delta[0] += sign * amount
+            delta[1] += sign
+    for recipe_id, deltas in by_recipe.items():
+        if recipe_id in deleting_recipes():
+            continue
+        ShoppingCartIngredient.objects.apply(
+            ShoppingList.objects.filter(
+                recipe_id=recipe_id).values_list('user_id', flat=True),
+            {pk: tuple(delta) for pk, delta in deltas.items()}
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def catalog_changed(sender, **kwargs):
+    bump_version(CATALOG)
+    if sender is Ingredient:
+        bump_version(INGREDIENTS)
+
+
+@receiver(pre_save, sender=User)
+def remember_author(sender, instance, raw=False, update_fields=None,
+                    **kwargs):
+    instance._author = None
+    if raw or instance.pk is None or (
+            update_fields is not None
+            and not set(AUTHOR_FIELDS) & set(update_fields)):
+        return
+    instance._author = sender.objects.filter(
+        pk=instance.pk).values_list(*AUTHOR_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, **kwargs):
+    """рецепты меняет только правка полей автора в их представлении.
+
+    Вход в систему, смена пароля и роли фрагменты не сбрасывают.
+    """
+    previous = getattr(instance, '_author', None)
+    if created or previous is None:
+        return
+    if previous != tuple(getattr(instance, field) for field in AUTHOR_FIELDS):
+        bump_version(CATALOG)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_changed(sender, action='post', **kwargs):
+    """правки рецептов мимо API тоже сбрасывают ETag и кэш."""
+    if action.startswith('post'):
+        bump_version(RECIPES)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    """уменьшенные копии нового изображения пишутся при сохранении."""
+    if instance.image:
+        make_variants(instance.image)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """файл изображения удаляется вместе с последним рецептом с ним."""
+    name = instance.image.name
+    transaction.on_commit(lambda: release_image(name))
+
+
+@receiver(pre_save, sender=Favorite)
+@receiver(pre_save, sender=ShoppingList)
+@receiver(pre_save, sender=Followers)
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_previous(sender, instance, raw=False, update_fields=None,
+                      **kwargs):
+    """прежняя строка нужна, чтобы перенести в счётчики только разницу."""
+    instance._previous = None
+    if raw or caller_denormalizes() or instance.pk is None or (
+            update_fields is not None
+            and not set(TRACKED_FIELDS[sender]) & set(update_fields)):
+        return
+    instance._previous = sender.objects.filter(pk=instance.pk).first()
+
+
+def tracked(instance):
+    return tuple(
+        getattr(instance, type(instance)._meta.get_field(name).attname)
+        for name in TRACKED_FIELDS[type(instance)]
+    )
+
+
+def link_changed(link, sign):
+    """счётчик объекта связи и, для корзины, суммы ингредиентов."""
+    target, field, counter = LINKS[type(link)]
+    target_id = getattr(link, f'{field}_id')
+    if target is Recipe and target_id in deleting_recipes():
+        return
+    target.objects.filter(pk=target_id).shift(counter, sign)
+    if isinstance(link, ShoppingList):
+        carts = ShoppingCartIngredient.objects
+        carts.apply(
+            [link.user_id], carts.recipe_deltas([target_id], sign=sign))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_save, sender=Followers)
+def link_saved(sender, instance, created, raw=False, **kwargs):
+    """связи из админки и shell учитываются в той же транзакции."""
+    if raw or caller_denormalizes():
+        return
+    previous = getattr(instance, '_previous', None)
+    if not created and previous is not None:
+        if tracked(previous) == tracked(instance):
+            return
+        link_changed(previous, -1)
+    link_changed(instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_delete, sender=Followers)
+def link_deleted(sender, instance, **kwargs):
+    if not caller_denormalizes():
+        link_changed(instance, -1)
+
+
+def ingredient_row(row):
+    return row.recipe_id, row.ingredient_id, row.amount
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, raw=False, **kwargs):
+    if raw or caller_denormalizes():
+        return
+    previous = getattr(instance, '_previous', None)
+    apply_to_carts(
+        removed=[ingredient_row(previous)] if previous is not None else [],
+        added=[ingredient_row(instance)]
+    )
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    if not caller_denormalizes():
+        apply_to_carts(removed=[ingredient_row(instance)])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, created, raw=False, **kwargs):
+    """число рецептов автора, в том числе при смене автора в админке."""
+    if raw or caller_denormalizes():
+        return
+    previous = getattr(instance, '_previous', None)
+    if not created and previous is not None:
+        if previous.author_id == instance.author_id:
+            return
+        User.objects.filter(pk=previous.author_id).shift('recipes_count', -1)
+    if created or previous is not None:
+        User.objects.filter(pk=instance.author_id).shift('recipes_count')
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    """рецепт уходит из корзин целиком, до каскадного удаления строк.
+
+    Строки избранного, корзин и ингредиентов удаляемого рецепта
+    счётчики и суммы уже не меняют.
+    """
+    if caller_denormalizes():
+        return
+    carts = ShoppingCartIngredient.objects
+    carts.apply(
+        ShoppingList.objects.filter(
+            recipe=instance).values_list('user_id', flat=True),
+        carts.recipe_deltas([instance.pk], sign=-1)
+    )
+    deleting_recipes().add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_gone(sender, instance, **kwargs):
+    """каскад удаляет зависимые строки раньше самого рецепта."""
+    deleting_recipes().discard(instance.pk)
+    if not caller_denormalizes():
+        User.objects.filter(pk=instance.author_id).shift('recipes_count', -1)
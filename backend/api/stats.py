@@ -0,0 +1,4 @@
+def percentile(values, share):
+    """значение, которого не превышает доля share отсортированных values."""
+    index = min(len(values) - 1, int(round(share * (len(values) - 1))))
+    return values[index]
@@ -0,0 +1,85 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from recipes.models import (Recipe, RecipeIngredient, ShoppingCartIngredient,
+                            ShoppingList)
+from .utils import (TemporaryMediaMixin, client_for, make_catalog, make_recipe,
+                    make_user)
+
+
+class CartTotalsSignalTest(TemporaryMediaMixin, TestCase):
+    """правки мимо API (админка, shell) тоже меняют суммы корзин."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.buyer = make_user('buyer')
+        _, cls.ingredients = make_catalog()
+        first, second, _ = cls.ingredients
+        cls.recipe = make_recipe(
+            cls.author, ingredients=[(first, 5), (second, 7)])
+        cls.other = make_recipe(
+            cls.author, name='Другой', ingredients=[(first, 3)])
+
+    def totals(self):
+        return {
+            row.ingredient_id: (row.total_amount, row.recipe_count)
+            for row in self.buyer.cart_ingredients.all()
+        }
+
+    def download(self):
+        self.buyer.refresh_from_db()
+        response = client_for(self.buyer).get(
+            '/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def add_to_cart(self):
+        for recipe in (self.recipe, self.other):
+            ShoppingList.objects.create(user=self.buyer, recipe=recipe)
+
+    def test_cart_rows(self):
+        first, second, _ = self.ingredients
+        self.add_to_cart()
+        self.assertEqual(self.totals(), {first.pk: (8, 2), second.pk: (7, 1)})
+        ShoppingList.objects.get(recipe=self.other).delete()
+        self.assertEqual(self.totals(), {first.pk: (5, 1), second.pk: (7, 1)})
+        ShoppingList.objects.filter(user=self.buyer).delete()
+        self.assertEqual(self.totals(), {})
+
+    def test_recipe_ingredients(self):
+        first, second, third = self.ingredients
+        self.add_to_cart()
+        row = RecipeIngredient.objects.get(recipe=self.recipe, ingredient=first)
+        row.amount = 10
+        row.save()
+        RecipeIngredient.objects.get(
+            recipe=self.recipe, ingredient=second).delete()
+        self.recipe.recipeingredient_set.create(ingredient=third, amount=2)
+        self.assertEqual(
+            self.totals(), {first.pk: (13, 2), third.pk: (2, 1)})
+
+    def test_recipe_delete(self):
+        first, second, _ = self.ingredients
+        self.add_to_cart()
+        self.assertIn(second.name, self.download())
+        Recipe.objects.get(pk=self.recipe.pk).delete()
+        self.assertEqual(self.totals(), {first.pk: (3, 1)})
+        self.assertNotIn(second.name, self.download())
+
+    def test_author_delete(self):
+        self.add_to_cart()
+        self.author.delete()
+        self.assertEqual(self.totals(), {})
+
+    def test_rebuild(self):
+        first, second, _ = self.ingredients
+        self.add_to_cart()
+        ShoppingCartIngredient.objects.filter(ingredient=first).update(
+            total_amount=1)
+        self.assertIn(f'{first.name} - 1 г', self.download())
+        call_command('rebuild_cart_totals', stdout=StringIO())
+        self.assertEqual(self.totals(), {first.pk: (8, 2), second.pk: (7, 1)})
+        self.assertIn(f'{first.name} - 8 г', self.download())
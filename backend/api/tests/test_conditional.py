@@ -0,0 +1,56 @@
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+
+from .utils import (TemporaryMediaMixin, client_for, make_catalog,
+                    make_recipe, make_user)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'conditional',
+}})
+class RecipeConditionalGetTest(TemporaryMediaMixin, TransactionTestCase):
+    """правка рецепта мимо API меняет ETag и тело списка и рецепта."""
+
+    def setUp(self):
+        self.author = make_user('author')
+        self.tag, self.ingredients = make_catalog()
+        self.recipe = make_recipe(
+            self.author, ingredients=[(self.ingredients[0], 10)],
+            tags=[self.tag])
+        self.client = client_for()
+
+    def assert_changed(self, path, change, step):
+        etag = self.client.get(path)['ETag']
+        self.assertEqual(
+            self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        field, value = change(step)
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        recipe = response.data
+        if 'results' in recipe:
+            recipe, = recipe['results']
+        self.assertEqual(field(recipe), value)
+
+    def rename(self, step):
+        self.recipe.name = f'Новое название {step}'
+        self.recipe.save()
+        return lambda recipe: recipe['name'], self.recipe.name
+
+    def change_amount(self, step):
+        self.recipe.recipeingredient_set.update_or_create(
+            ingredient=self.ingredients[0], defaults={'amount': 20 + step})
+        return lambda recipe: recipe['ingredients'][0]['amount'], 20 + step
+
+    def change_tags(self, step):
+        tags = [self.tag] if step else []
+        self.recipe.tags.set(tags)
+        return lambda recipe: len(recipe['tags']), len(tags)
+
+    def test_model_changes(self):
+        paths = ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/')
+        for step, path in enumerate(paths):
+            for change in (self.rename, self.change_amount, self.change_tags):
+                with self.subTest(path=path, change=change.__name__):
+                    self.assert_changed(path, change, step)
@@ -0,0 +1,117 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+
+from api.serializers import RecipeCreateSerializer, UsersSerializer
+from recipes.models import Favorite, Recipe, ShoppingList
+from users.models import Followers, User
+from .utils import TemporaryMediaMixin, make_catalog, make_recipe, make_user
+
+
+class CounterSaveTest(TemporaryMediaMixin, TestCase):
+    """сохранение объекта, прочитанного до сдвига счётчиков, их не затирает."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        _, ingredients = make_catalog()
+        cls.recipe = make_recipe(cls.author, ingredients=[(ingredients[0], 5)])
+
+    def request(self):
+        request = APIRequestFactory().patch('/')
+        request.user = self.author
+        return request
+
+    def test_recipe_update(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        published = recipe.pub_date
+        Recipe.objects.filter(pk=recipe.pk).shift('favorites_count', 2)
+        Recipe.objects.filter(pk=recipe.pk).shift('in_carts_count', 1)
+        serializer = RecipeCreateSerializer(
+            recipe, data={'name': 'Новое'}, partial=True,
+            context={'request': self.request()})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое')
+        self.assertGreater(recipe.pub_date, published)
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (2, 1))
+
+    def test_user_update(self):
+        user = User.objects.get(pk=self.author.pk)
+        counters = ('recipes_count', 'followers_count', 'cart_version')
+        before = User.objects.values_list(*counters).get(pk=user.pk)
+        for field in counters:
+            User.objects.filter(pk=user.pk).shift(field, 3)
+        serializer = UsersSerializer(
+            user, data={'first_name': 'Новое'}, partial=True,
+            context={'request': self.request()})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        user.set_password('new-password')
+        user.save()
+        user.refresh_from_db()
+        self.assertEqual(user.first_name, 'Новое')
+        self.assertTrue(user.check_password('new-password'))
+        self.assertEqual(
+            [getattr(user, field) for field in counters],
+            [value + 3 for value in before])
+
+
+class CounterSignalTest(TemporaryMediaMixin, TestCase):
+    """правки мимо API (админка, shell) тоже сдвигают счётчики."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.reader = make_user('reader')
+        _, cls.ingredients = make_catalog()
+
+    def assert_counters_consistent(self):
+        call_command('rebuild_counters', '--check', stdout=StringIO())
+
+    def counters(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.favorites_count, recipe.in_carts_count
+
+    def test_recipe(self):
+        recipe = make_recipe(self.author)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        recipe.author = self.reader
+        recipe.save()
+        self.assert_counters_consistent()
+        Recipe.objects.get(pk=recipe.pk).delete()
+        self.reader.refresh_from_db()
+        self.assertEqual(self.reader.recipes_count, 0)
+        self.assert_counters_consistent()
+
+    def test_links(self):
+        recipe = make_recipe(self.author)
+        for user in (self.author, self.reader):
+            Favorite.objects.create(user=user, recipe=recipe)
+        ShoppingList.objects.create(user=self.reader, recipe=recipe)
+        Followers.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.counters(recipe), (2, 1))
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assert_counters_consistent()
+        Favorite.objects.filter(user=self.author).delete()
+        self.assertEqual(self.counters(recipe), (1, 1))
+        self.reader.delete()
+        self.assertEqual(self.counters(recipe), (0, 0))
+        self.assert_counters_consistent()
+
+    def test_recipe_cascade(self):
+        recipe = make_recipe(
+            self.author, ingredients=[(self.ingredients[0], 5)])
+        other = make_recipe(self.author, name='Другой')
+        for target in (recipe, other):
+            Favorite.objects.create(user=self.reader, recipe=target)
+            ShoppingList.objects.create(user=self.reader, recipe=target)
+        self.author.delete()
+        self.assertFalse(self.reader.cart_ingredients.exists())
+        self.assert_counters_consistent()
@@ -0,0 +1,121 @@
+import csv
+import io
+import json
+import os
+import re
+import zlib
+from unittest import skipUnless
+
+from django.conf import settings
+from django.test import TestCase
+
+from recipes.models import ShoppingList
+from users.models import User
+from .utils import (TemporaryMediaMixin, client_for, make_catalog, make_recipe,
+                    make_user)
+
+
+def pdf_objects(data):
+    """{номер: тело} по таблице xref, на которую указывает startxref."""
+    xref = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', data).group(1))
+    match = re.match(rb'xref\n0 (\d+)\n', data[xref:])
+    entries = data[xref + match.end():].split(b'\n')[:int(match.group(1))]
+    objects = {}
+    for number, entry in enumerate(entries[1:], 1):
+        offset = int(entry[:10])
+        header = b'%d 0 obj\n' % number
+        assert data[offset:offset + len(header)] == header, number
+        start = offset + len(header)
+        end = data.index(b'\nendobj\n', start)
+        stream = data.find(b'stream\n', start, end)
+        if stream < 0:
+            objects[number] = data[start:end]
+            continue
+        length = int(re.search(rb'/Length (\d+)', data[start:stream]).group(1))
+        stream += len(b'stream\n')
+        objects[number] = zlib.decompress(data[stream:stream + length])
+    return objects
+
+
+def pdf_lines(data):
+    """строки текста страниц, декодированные через ToUnicode."""
+    objects = pdf_objects(data)
+    font = next(body for body in objects.values() if b'/ToUnicode' in body)
+    cmap = objects[int(re.search(rb'/ToUnicode (\d+) 0 R', font).group(1))]
+    chars = {
+        glyph: chr(int(code, 16))
+        for glyph, code in re.findall(rb'<([0-9A-F]{4})> <([0-9A-F]{4})>',
+                                      cmap)
+    }
+    lines = []
+    for body in objects.values():
+        for text in re.findall(rb'<([0-9A-F]*)> Tj', body):
+            lines.append(''.join(
+                chars[text[start:start + 4]]
+                for start in range(0, len(text), 4)))
+    return lines
+
+
+class ShoppingListExportTest(TemporaryMediaMixin, TestCase):
+    """список покупок в каждом формате: тип ответа и содержимое."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = make_user('author')
+        cls.buyer = make_user('buyer')
+        _, ingredients = make_catalog()
+        first, second, _ = ingredients
+        for recipe in (
+                make_recipe(author, ingredients=[(first, 5), (second, 7)]),
+                make_recipe(author, name='Другой', ingredients=[(first, 3)])):
+            ShoppingList.objects.create(user=cls.buyer, recipe=recipe)
+        cls.buyer.refresh_from_db()
+        cls.rows = [
+            [first.name, '8', first.measurement_unit],
+            [second.name, '7', second.measurement_unit],
+        ]
+
+    def download(self, export_format, content_type):
+        response = client_for(self.buyer).get(
+            f'/api/recipes/download_shopping_cart/?format={export_format}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], content_type)
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment; filename="shopping_list.{export_format}"')
+        return b''.join(response.streaming_content)
+
+    def test_txt(self):
+        data = self.download('txt', 'text/plain; charset=utf-8')
+        self.assertEqual(data.decode().splitlines(), [
+            'Список покупок:',
+            *(f'{name} - {amount} {unit}' for name, amount, unit in self.rows),
+        ])
+
+    def test_csv(self):
+        text = self.download('csv', 'text/csv; charset=utf-8').decode()
+        self.assertTrue(text.startswith('\ufeff'))
+        self.assertEqual(list(csv.reader(io.StringIO(text[1:]))), [
+            ['name', 'amount', 'measurement_unit'], *self.rows])
+
+    def test_json(self):
+        data = self.download('json', 'application/json')
+        self.assertEqual(json.loads(data), [
+            {'name': name, 'amount': int(amount), 'measurement_unit': unit}
+            for name, amount, unit in self.rows
+        ])
+
+    @skipUnless(os.path.exists(settings.SHOPPING_LIST_FONT), 'нет шрифта')
+    def test_pdf(self):
+        data = self.download('pdf', 'application/pdf')
+        self.assertTrue(data.startswith(b'%PDF-1.4\n'))
+        self.assertEqual(pdf_lines(data), [
+            'Список покупок',
+            *(f'{name} - {amount} {unit}' for name, amount, unit in self.rows),
+        ])
+
+    def test_empty_cart(self):
+        ShoppingList.objects.filter(user=self.buyer).delete()
+        self.buyer = User.objects.get(pk=self.buyer.pk)
+        self.assertEqual(json.loads(
+            self.download('json', 'application/json')), [])
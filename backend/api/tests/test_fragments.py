@@ -0,0 +1,51 @@
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+
+from api.fragments import CATALOG
+from api.versions import get_versions
+from .utils import (TemporaryMediaMixin, client_for, make_catalog,
+                    make_recipe, make_user)
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'fragments',
+}})
+class RecipeFragmentTest(TemporaryMediaMixin, TransactionTestCase):
+    """фрагмент рецепта не переживает правку ингредиентов и тэгов."""
+
+    def setUp(self):
+        self.author = make_user('author')
+        self.tag, self.ingredients = make_catalog()
+        self.recipe = make_recipe(
+            self.author, ingredients=[(self.ingredients[0], 10)],
+            tags=[self.tag])
+        self.client = client_for()
+
+    def listed(self):
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        recipe, = response.data['results']
+        return recipe
+
+    def test_ingredients_and_tags(self):
+        self.assertEqual(self.listed()['ingredients'][0]['amount'], 10)
+        self.recipe.recipeingredient_set.update_or_create(
+            ingredient=self.ingredients[0], defaults={'amount': 20})
+        self.assertEqual(self.listed()['ingredients'][0]['amount'], 20)
+        self.recipe.recipeingredient_set.get().delete()
+        self.assertEqual(self.listed()['ingredients'], [])
+        self.recipe.tags.clear()
+        self.assertEqual(self.listed()['tags'], [])
+
+    def test_author_fields(self):
+        version, = get_versions(CATALOG)
+        self.author.set_password('new password')
+        self.author.save()
+        self.author.last_name = self.author.last_name
+        self.author.save()
+        self.assertEqual(get_versions(CATALOG), [version])
+        self.author.first_name = 'Автор'
+        self.author.save()
+        self.assertNotEqual(get_versions(CATALOG), [version])
+        self.assertEqual(self.listed()['author']['first_name'], 'Автор')
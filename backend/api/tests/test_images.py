@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+from io import StringIO
+from unittest import skipUnless
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+
+from api.fragments import CATALOG
+from api.versions import RECIPES, get_versions
+from recipes.images import (FORMATS, VARIANTS, release_image, variant_names,
+                            variant_spec)
+from recipes.models import Recipe
+from .utils import TemporaryMediaMixin, image_file, make_recipe, make_user
+
+
+class VariantNameTest(TestCase):
+    """адрес копии зависит от её настроек."""
+
+    def test_spec_in_name(self):
+        names = variant_names('recipes/images/ab/abc.png')
+        self.assertEqual(set(names), {variant for variant, _ in VARIANTS})
+        paths = [path for formats in names.values()
+                 for path in formats.values()]
+        self.assertEqual(len(set(paths)), len(VARIANTS) * len(FORMATS))
+        self.assertRegex(
+            names['card']['jpeg'],
+            r'^recipes/images/ab/variants/abc_card\.[0-9a-f]{8}\.jpg$')
+
+    def test_spec_changes(self):
+        _, extension, options = FORMATS[0]
+        spec = variant_spec(480, extension, options)
+        self.assertNotEqual(spec, variant_spec(640, extension, options))
+        self.assertNotEqual(
+            spec, variant_spec(480, extension, {**options, 'quality': 60}))
+
+
+class ReleaseImageTest(TemporaryMediaMixin, TransactionTestCase):
+    """файл удаляется только вместе с последним рецептом с ним."""
+
+    def setUp(self):
+        self.author = make_user('author')
+        self.storage = Recipe._meta.get_field('image').storage
+
+    def test_shared_file(self):
+        first = make_recipe(self.author)
+        second = make_recipe(self.author)
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        first.delete()
+        self.assertTrue(self.storage.exists(name))
+        second.delete()
+        self.assertFalse(self.storage.exists(name))
+        for formats in variant_names(name).values():
+            for path in formats.values():
+                self.assertFalse(self.storage.exists(path))
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен Postgres')
+    def test_concurrent_upload(self):
+        """загрузка того же файла во время удаления его не теряет."""
+        name = self.storage.save('recipes/images/a.png', image_file())
+        saved = threading.Event()
+
+        def upload():
+            try:
+                with transaction.atomic():
+                    make_recipe(self.author)
+                    saved.set()
+                    time.sleep(0.5)
+            finally:
+                saved.set()
+                connection.close()
+
+        thread = threading.Thread(target=upload)
+        thread.start()
+        saved.wait()
+        release_image(name)
+        thread.join()
+        self.assertTrue(Recipe.objects.filter(image=name).exists())
+        self.assertTrue(self.storage.exists(name))
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'images',
+}})
+class DedupeImagesTest(TemporaryMediaMixin, TransactionTestCase):
+    """переименование старых файлов сбрасывает закэшированные адреса."""
+
+    def test_versions_bumped(self):
+        recipe = make_recipe(make_user('author'))
+        storage = Recipe._meta.get_field('image').storage
+        legacy = 'recipes/images/legacy_Ab3dE.png'
+        os.makedirs(os.path.dirname(storage.path(legacy)), exist_ok=True)
+        with storage.open(recipe.image.name) as source:
+            with open(storage.path(legacy), 'wb') as target:
+                target.write(source.read())
+        Recipe.objects.filter(pk=recipe.pk).update(image=legacy)
+        versions = get_versions(RECIPES, CATALOG)
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertIn(legacy, response.data['image'])
+        call_command('collect_image_garbage', stdout=StringIO())
+        new_versions = get_versions(RECIPES, CATALOG)
+        for old, new in zip(versions, new_versions):
+            self.assertGreater(new, old)
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(legacy, response.data['image'])
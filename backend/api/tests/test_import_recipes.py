@@ -0,0 +1,69 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from recipes.models import Recipe
+from .utils import TemporaryMediaMixin, make_catalog, make_recipe, make_user
+
+
+class ImportRecipesTest(TemporaryMediaMixin, TestCase):
+    """повторная загрузка и занятые id не теряют рецепты."""
+
+    def setUp(self):
+        self.author = make_user('author')
+        self.tag, ingredients = make_catalog()
+        self.recipe = make_recipe(
+            self.author, name='Суп', ingredients=[(ingredients[0], 10)],
+            tags=[self.tag])
+        descriptor, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(descriptor)
+        self.addCleanup(os.unlink, self.path)
+        call_command('export_recipes', self.path, stderr=StringIO())
+
+    def load(self):
+        errors = StringIO()
+        call_command('import_recipes', self.path, '--no-variants',
+                     stdout=StringIO(), stderr=errors)
+        return errors.getvalue()
+
+    def test_same_recipe_skipped(self):
+        self.load()
+        self.assertEqual(Recipe.objects.count(), 1)
+
+    def test_round_trip(self):
+        pk = self.recipe.pk
+        Recipe.objects.all().delete()
+        self.load()
+        recipe = Recipe.objects.get()
+        self.assertEqual((recipe.pk, recipe.name), (pk, 'Суп'))
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertEqual(recipe.recipeingredient_set.get().amount, 10)
+
+    def test_id_collision(self):
+        """id занят другим рецептом: входящий получает новый id."""
+        Recipe.objects.filter(pk=self.recipe.pk).update(name='Другой')
+        errors = self.load()
+        self.assertIn(f'Рецепт {self.recipe.pk}: id занят', errors)
+        imported = Recipe.objects.get(name='Суп')
+        self.assertNotEqual(imported.pk, self.recipe.pk)
+        self.assertEqual(list(imported.tags.all()), [self.tag])
+        self.assertEqual(imported.recipeingredient_set.get().amount, 10)
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipe.pk).name, 'Другой')
+        self.load()
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_collision_keeps_later_ids(self):
+        """новый id не занимает id рецепта из следующей пачки."""
+        later = make_recipe(self.author, name='Каша').pk
+        call_command('export_recipes', self.path, stderr=StringIO())
+        Recipe.objects.filter(pk=self.recipe.pk).update(name='Другой')
+        Recipe.objects.filter(pk=later).delete()
+        call_command('import_recipes', self.path, '--no-variants',
+                     '--chunk-size', '1', stdout=StringIO(),
+                     stderr=StringIO())
+        self.assertEqual(Recipe.objects.get(name='Каша').pk, later)
+        self.assertGreater(Recipe.objects.get(name='Суп').pk, later)
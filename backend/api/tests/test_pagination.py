@@ -0,0 +1,65 @@
+import base64
+import json
+
+from django.test import TestCase
+
+from .utils import (TemporaryMediaMixin, client_for, make_catalog,
+                    make_recipe, make_user)
+
+
+def cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+class KeysetCursorTest(TemporaryMediaMixin, TestCase):
+    """испорченный курсор даёт 404, а не ошибку сервера."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = make_user('author')
+        _, ingredients = make_catalog()
+        for number in range(3):
+            make_recipe(author, name=f'Рецепт {number}',
+                        ingredients=[(ingredients[0], 10)])
+        for name in ('Борщ с рецептом борща', 'Рецепт борща', 'Борщ'):
+            make_recipe(author, name=name,
+                        ingredients=[(ingredients[0], 10)])
+
+    def get(self, value):
+        return client_for().get('/api/recipes/', {'cursor': value, 'limit': 2})
+
+    def test_pages(self):
+        first = self.get('').json()
+        self.assertEqual(len(first['results']), 2)
+        second = client_for().get(first['next']).json()
+        self.assertEqual(len(second['results']), 2)
+
+    def test_search_pages_keep_rank(self):
+        """с поиском курсор не действует: страницы идут по рангу."""
+        client = client_for()
+        everything = client.get(
+            '/api/recipes/', {'search': 'борщ', 'limit': 10}).json()
+        names = [recipe['name'] for recipe in everything['results']]
+        pages = []
+        response = client.get(
+            '/api/recipes/', {'search': 'борщ', 'limit': 2, 'cursor': ''})
+        while True:
+            page = response.json()
+            self.assertIn('count', page)
+            pages.extend(recipe['name'] for recipe in page['results'])
+            if not page['next']:
+                break
+            response = client.get(page['next'])
+        self.assertEqual(pages, names)
+
+    def test_malformed(self):
+        for value in (
+            'не base64', cursor('строка'), cursor([1, 2]), cursor({}),
+            cursor({'p': 5}), cursor({'p': 'ab'}), cursor({'p': [1]}),
+            cursor({'p': [1, 2, 3]}), cursor({'p': ['вчера', 1]}),
+            cursor({'p': [None, 1]}), cursor({'p': [[1], 1]}),
+            cursor({'p': ['2022-12-10T10:00:00+00:00', 'x']}),
+            cursor({'p': ['2022-12-10T10:00:00+00:00', {'a': 1}]}),
+        ):
+            with self.subTest(cursor=value):
+                self.assertEqual(self.get(value).status_code, 404)
@@ -0,0 +1,78 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from api.fragments import CATALOG
+from api.query_budgets import DATASETS, PAGE_SIZES, QUERY_BUDGETS
+from api.scenarios import Scenarios
+from api.search import INGREDIENTS
+from api.versions import RECIPES, bump_version, viewer_namespaces
+from .utils import TemporaryMediaMixin
+
+
+def with_page_size(path, size):
+    separator = '&' if '?' in path else '?'
+    return f'{path}{separator}limit={size}'
+
+
+def describe(samples):
+    """число запросов по прогонам и SQL самого тяжёлого из них."""
+    detail = ', '.join(
+        f'{dataset}/{size or "-"}: {len(queries)}'
+        for dataset, size, queries in samples)
+    worst = max(samples, key=lambda sample: len(sample[2]))[2]
+    return '\n'.join(
+        [detail, *(' '.join(query['sql'].split()) for query in worst)])
+
+
+class QueryBudgetTest(TemporaryMediaMixin, TransactionTestCase):
+    """запросы к API укладываются в потолки из api/query_budgets.py.
+
+    Каждый сценарий прогоняется на малом и большом наборе данных,
+    списки - ещё и со страницами разного размера: число запросов
+    не должно расти ни с данными, ни со страницей.
+    """
+
+    def measure(self):
+        """{сценарий: [(набор данных, страница, SQL-запросы), ...]}."""
+        runs = {}
+        created = {'users': 0, 'recipes': 0}
+        for dataset, sizes in DATASETS:
+            call_command(
+                'generate_fake_data', stdout=StringIO(),
+                users=sizes['users'] - created['users'],
+                recipes=sizes['recipes'] - created['recipes'])
+            created = dict(sizes)
+            scenarios = Scenarios()
+            for scenario in scenarios.cases():
+                _, paginated = QUERY_BUDGETS.get(
+                    scenario['name'], (None, False))
+                for size in PAGE_SIZES if paginated else (None,):
+                    if size:
+                        scenario = dict(
+                            scenario,
+                            path=with_page_size(scenario['path'], size))
+                    runs.setdefault(scenario['name'], []).append(
+                        (dataset, size, self.cold_run(scenarios, scenario)))
+        return runs
+
+    @staticmethod
+    def cold_run(scenarios, scenario):
+        """запросы при пустом кэше: все версии сдвинуты перед запросом."""
+        fixtures = scenarios.fixtures
+        bump_version(
+            RECIPES, CATALOG, INGREDIENTS,
+            *viewer_namespaces(fixtures['user']),
+            *viewer_namespaces(fixtures['author']))
+        return scenarios.run(scenario)[1]
+
+    def test_query_budgets(self):
+        runs = self.measure()
+        self.assertEqual(set(runs), set(QUERY_BUDGETS))
+        for name, (budget, _) in QUERY_BUDGETS.items():
+            with self.subTest(name):
+                samples = runs[name]
+                counts = [len(queries) for _, _, queries in samples]
+                self.assertLessEqual(max(counts), budget, describe(samples))
+                self.assertEqual(min(counts), max(counts), describe(samples))
@@ -0,0 +1,96 @@
+import threading
+
+from django.db import connection
+from django.test import TransactionTestCase, skipUnlessDBFeature
+
+from recipes.models import Favorite, Recipe, ShoppingList
+from users.models import Followers, User
+from .utils import (TemporaryMediaMixin, client_for, make_catalog,
+                    make_recipe, make_user)
+
+
+class RelationConcurrencyTest(TemporaryMediaMixin, TransactionTestCase):
+    """повторные и параллельные запросы создают ровно одну связь."""
+
+    def setUp(self):
+        self.user = make_user('user')
+        self.author = make_user('author')
+        _, ingredients = make_catalog()
+        self.recipe = make_recipe(
+            self.author, ingredients=[(ingredients[0], 10)])
+
+    def relations(self):
+        """(url, bulk url, id, модель связи, цель, счётчик)."""
+        recipe, author = self.recipe.pk, self.author.pk
+        return (
+            (f'/api/recipes/{recipe}/favorite/', '/api/recipes/favorite/',
+             recipe, Favorite, Recipe, 'favorites_count'),
+            (f'/api/recipes/{recipe}/shopping_cart/',
+             '/api/recipes/shopping_cart/',
+             recipe, ShoppingList, Recipe, 'in_carts_count'),
+            (f'/api/users/{author}/subscribe/', '/api/users/subscribe/',
+             author, Followers, User, 'followers_count'),
+        )
+
+    def assert_single(self, model, target, counter, pk):
+        self.assertEqual(model.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(
+            target.objects.values_list(counter, flat=True).get(pk=pk), 1)
+
+    def reset(self, model, target, counter, pk):
+        model.objects.all().delete()
+        target.objects.filter(pk=pk).update(**{counter: 0})
+
+    def post_twice(self, url, data=None):
+        client = client_for(self.user)
+        return [client.post(url, data, format='json') for _ in range(2)]
+
+    def post_parallel(self, url, data=None):
+        """два запроса из разных потоков стартуют одновременно."""
+        barrier = threading.Barrier(2)
+        statuses = []
+
+        def request():
+            client = client_for(self.user)
+            barrier.wait()
+            try:
+                statuses.append(
+                    client.post(url, data, format='json').status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=request) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_double_post(self):
+        for url, _, pk, model, target, counter in self.relations():
+            with self.subTest(url=url):
+                self.assertEqual(
+                    [response.status_code for response in self.post_twice(
+                        url)], [201, 400])
+                self.assert_single(model, target, counter, pk)
+
+    def test_double_bulk_post(self):
+        for _, url, pk, model, target, counter in self.relations():
+            with self.subTest(url=url):
+                self.assertEqual(
+                    [response.json()['results'][0]['status']
+                     for response in self.post_twice(url, {'ids': [pk]})],
+                    ['created', 'exists'])
+                self.assert_single(model, target, counter, pk)
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_parallel_post(self):
+        for url, bulk_url, pk, model, target, counter in self.relations():
+            with self.subTest(url=url):
+                self.assertEqual(
+                    sorted(self.post_parallel(url)), [201, 400])
+                self.assert_single(model, target, counter, pk)
+                self.reset(model, target, counter, pk)
+                self.assertEqual(
+                    self.post_parallel(bulk_url, {'ids': [pk]}), [200, 200])
+                self.assert_single(model, target, counter, pk)
@@ -0,0 +1,105 @@
+import json
+import tracemalloc
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.views import RecipeViewSet
+from recipes.models import Recipe
+from .utils import (TemporaryMediaMixin, client_for, image_file,
+                    make_catalog, make_user)
+
+MAX_SIZE = 4 * 1024 * 1024
+
+
+def raw_png(size, name='raw.png'):
+    """png без сжатия: файл весит около 3 байт на пиксель."""
+    buffer = BytesIO()
+    Image.new('RGB', size, (90, 160, 60)).save(
+        buffer, 'PNG', compress_level=0)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(RECIPE_IMAGE={'MAX_SIZE': MAX_SIZE,
+                                 'MAX_PIXELS': 25 * 1000 * 1000})
+class RecipeImageUploadTest(TemporaryMediaMixin, TestCase):
+    """загрузка изображения рецепта multipart-формой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('author')
+        cls.tag, cls.ingredients = make_catalog()
+
+    def form(self, image):
+        return {
+            'name': 'Рецепт',
+            'text': 'текст',
+            'cooking_time': 10,
+            'tags': [self.tag.pk],
+            'ingredients': json.dumps(
+                [{'id': self.ingredients[0].pk, 'amount': 10}]),
+            'image': image,
+        }
+
+    def request(self, image):
+        request = APIRequestFactory().post(
+            '/api/recipes/', self.form(image), format='multipart')
+        force_authenticate(request, self.user)
+        return request
+
+    def post(self, image):
+        return client_for(self.user).post(
+            '/api/recipes/', self.form(image), format='multipart')
+
+    def test_upload_not_read_into_bytes(self):
+        """файл у предела размера не читается в объект bytes целиком.
+
+        tracemalloc видит только память Python: буферы Pillow, в том
+        числе целый раскодированный кадр PNG, в замер не попадают.
+        """
+        image = raw_png((1150, 1150))
+        self.assertLess(len(image), MAX_SIZE)
+        view = RecipeViewSet.as_view({'post': 'create'})
+        # первый запрос подгружает модули Pillow, их память не в счёт
+        self.assertEqual(view(self.request(image_file())).status_code, 201)
+        request = self.request(image)
+        tracemalloc.start()
+        try:
+            response = view(request)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertLess(peak, len(image) // 2)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+    def test_too_large_file(self):
+        response = self.post(raw_png((1300, 1300)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+
+    def test_too_large_base64(self):
+        data = self.form(None)
+        data['image'] = 'data:image/png;base64,' + 'A' * (MAX_SIZE * 2)
+        data['ingredients'] = json.loads(data['ingredients'])
+        response = client_for(self.user).post(
+            '/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+
+    @override_settings(RECIPE_IMAGE={'MAX_SIZE': MAX_SIZE,
+                                     'MAX_PIXELS': 100})
+    def test_too_many_pixels(self):
+        response = self.post(image_file((32, 32)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+
+    def test_not_an_image(self):
+        response = self.post(
+            SimpleUploadedFile('image.png', b'not an image'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+        self.assertFalse(Recipe.objects.exists())
@@ -0,0 +1,72 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.documents import shopping_lists
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+def image_file(size=(32, 32), name='image.png', image_format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+def make_user(name):
+    return User.objects.create_user(
+        email=f'{name}@example.com', username=name, password='password',
+        first_name=name, last_name=name)
+
+
+def make_recipe(author, name='Рецепт', ingredients=(), tags=()):
+    recipe = Recipe.objects.create(
+        author=author, name=name, text='текст', cooking_time=10,
+        image=image_file())
+    for ingredient, amount in ingredients:
+        recipe.recipeingredient_set.create(
+            ingredient=ingredient, amount=amount)
+    recipe.tags.set(tags)
+    return recipe
+
+
+def make_catalog():
+    tag = Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+    ingredients = [
+        Ingredient.objects.create(name=f'ингредиент {number}',
+                                  measurement_unit='г')
+        for number in range(3)
+    ]
+    return tag, ingredients
+
+
+def client_for(user=None):
+    client = APIClient()
+    if user is not None:
+        client.force_authenticate(user)
+    return client
+
+
+class TemporaryMediaMixin:
+    """файлы изображений и списков покупок - во временном каталоге."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media = tempfile.mkdtemp()
+        cls._media_settings = override_settings(MEDIA_ROOT=cls._media)
+        cls._media_settings.enable()
+        cls._documents = shopping_lists.location
+        shopping_lists.location = f'{cls._media}/shopping_lists'
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shopping_lists.location = cls._documents
+        cls._media_settings.disable()
+        shutil.rmtree(cls._media, ignore_errors=True)
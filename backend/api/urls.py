@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (FavoriteViewSet, TagViewSet, RecipeViewSet, UserViewSet,
                     ShoppingListView, FollowersView, download_shopping_list,
-                    UserFollowView, IngredientViewSet)
+                    UserFollowView, IngredientViewSet, BulkFavoriteView,
+                    BulkShoppingListView, BulkFollowersView)
 
 app_name = 'api'
 
@@ -20,6 +21,21 @@ urlpatterns = [
         download_shopping_list,
         name='download_shopping_cart'
     ),
+    path(
+        'recipes/shopping_cart/',
+        BulkShoppingListView.as_view(),
+        name='shopping_cart_bulk'
+    ),
+    path(
+        'recipes/favorite/',
+        BulkFavoriteView.as_view(),
+        name='favorite_bulk'
+    ),
+    path(
+        'users/subscribe/',
+        BulkFollowersView.as_view(),
+        name='subscribe_bulk'
+    ),
     path(
         'recipes/<int:id>/shopping_cart/',
         ShoppingListView.as_view(),
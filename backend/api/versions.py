@@ -0,0 +1,54 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .loaders import FAVORITES, SHOPPING_CART, SUBSCRIPTIONS
+
+RECIPES = 'recipes.recipe'
+
+
+def _key(namespace):
+    return f'version:{namespace}'
+
+
+def _now():
+    return int(time.time() * 1000)
+
+
+def get_versions(*namespaces):
+    """текущие версии пространств имён для ключей кэша.
+
+    Версия - время последнего изменения в мс, поэтому годится и для
+    Last-Modified. Пропавшая из кэша версия заводится заново от текущего
+    времени и не совпадает ни с одной из выданных ранее.
+    """
+    keys = [_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _now(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(*namespaces):
+    """сдвигает версии после фиксации транзакции."""
+    def bump():
+        for namespace, version in zip(namespaces, get_versions(*namespaces)):
+            cache.set(_key(namespace), max(version + 1, _now()), None)
+    transaction.on_commit(bump)
+
+
+def viewer_namespace(relation, user):
+    return f'{relation}:{user.pk}'
+
+
+def viewer_namespaces(user):
+    """версии, от которых зависят флаги пользователя в ответах."""
+    if user is None or user.is_anonymous:
+        return []
+    return [
+        viewer_namespace(relation, user)
+        for relation in (FAVORITES, SHOPPING_CART, SUBSCRIPTIONS)
+    ]
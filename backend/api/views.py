@@ -1,53 +1,132 @@
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import Count, Max
+from django.http import FileResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.generics import ListAPIView
 from rest_framework import status, viewsets
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import (action, api_view, permission_classes,
+                                       renderer_classes)
+from rest_framework.exceptions import NotFound
 from rest_framework.views import APIView
 from rest_framework.permissions import (AllowAny,
                                         IsAuthenticated)
 from rest_framework.response import Response
-from recipes.models import (Ingredient, RecipeIngredient, Recipe,
+from recipes.models import (Ingredient, Recipe, ShoppingCartIngredient,
                             ShoppingList, Tag, Favorite)
 from users.models import Followers
-from .filters import RecipeFilter, IngredientFilter
+from .documents import shopping_lists
+from .exports import EXPORT_RENDERERS, EXPORTS, shopping_list_rows
+from .filters import RecipeFilter
+from .fragments import CATALOG
+from .loaders import FAVORITES, SHOPPING_CART, SUBSCRIPTIONS
+from .mixins import ConditionalGetMixin
 from .paginations import CustomPagination
 from .permissions import IsAdminOrAuthorOrReadOnly
+from .search import INGREDIENTS, ingredient_search
+from .signals import denormalized_by_caller
+from .versions import (RECIPES, bump_version, get_versions,
+                       viewer_namespace, viewer_namespaces)
 from .serializers import (TagSerializer, IngredientSerializer, UsersSerializer,
-                          FollowUsersSerializer, FavoriteSerializer,
-                          RecipeCreateSerializer, RecipeSerializer,
-                          ShoppingListSerializer, FollowerSerializer)
+                          BulkIdsSerializer, RecipeCreateSerializer,
+                          RecipeSerializer, UserFavoriteSerializer,
+                          FollowerSerializer)
 
 
 User = get_user_model()
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class CatalogConditionalMixin(ConditionalGetMixin):
+    """справочники меняются только вместе с версией CATALOG."""
+
+    def get_conditional_validators(self):
+        version, = get_versions(CATALOG)
+        return [version], version / 1000
+
+
+class IngredientViewSet(CatalogConditionalMixin, viewsets.ModelViewSet):
+    """ингредиенты из индекса в памяти процесса, без запросов к базе."""
     queryset = Ingredient.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = IngredientSerializer
-    filter_backend = [DjangoFilterBackend, ]
-    filterset_class = IngredientFilter
     http_method_names = ('get',)
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional(self.search, request)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional(self.search_one, request, *args, **kwargs)
+
+    def search(self, request):
+        """?fuzzy=1 - только с опечатками, ?fuzzy=0 - только точно."""
+        fuzzy = request.query_params.get('fuzzy')
+        if fuzzy is not None:
+            fuzzy = fuzzy.lower() in ('1', 'true')
+        index = ingredient_search.get_index()
+        return Response(
+            index.search(request.query_params.get('name', ''), fuzzy))
+
+    def search_one(self, request, pk):
+        try:
+            ingredient = ingredient_search.get_index().get(int(pk))
+        except ValueError:
+            ingredient = None
+        if ingredient is None:
+            raise NotFound
+        return Response(ingredient)
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     permission_classes = (IsAdminOrAuthorOrReadOnly,)
     pagination_class = CustomPagination
+    keyset_ordering = ('-pub_date', '-id')
+    keyset_skip_params = ('search',)
     filter_class = RecipeFilter
     filter_backends = [DjangoFilterBackend, ]
 
+    def get_queryset(self):
+        """тэги и ингредиенты подгружает сериализатор при промахе кэша."""
+        return Recipe.objects.select_related('author')
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeSerializer
         return RecipeCreateSerializer
 
+    def get_conditional_validators(self):
+        """последний pub_date и число рецептов выборки плюс версии.
+
+        Правки вне API (админка, shell) сдвигают версию RECIPES сигналом.
+        """
+        queryset = self.filter_queryset(Recipe.objects.all())
+        try:
+            if self.action == 'retrieve':
+                queryset = queryset.filter(pk=self.kwargs['pk'])
+            state = queryset.aggregate(
+                last_modified=Max('pub_date'), total=Count('id'))
+        except (TypeError, ValueError, ValidationError):
+            return None, None
+        if not state['total']:
+            return None, None
+        versions = get_versions(
+            RECIPES, CATALOG, *viewer_namespaces(self.request.user))
+        last_modified = max(
+            state['last_modified'].timestamp(), max(versions) / 1000)
+        return [
+            state['total'], state['last_modified'].isoformat(), *versions
+        ], last_modified
+
+    def perform_destroy(self, instance):
+        """счётчики и суммы корзин сдвигают сигналы удаления рецепта."""
+        with transaction.atomic():
+            instance.delete()
+        bump_version(RECIPES)
 
-class TagViewSet(viewsets.ModelViewSet):
+
+class TagViewSet(CatalogConditionalMixin, viewsets.ModelViewSet):
     queryset = Tag.objects.all()
     permission_classes = (AllowAny,)
     serializer_class = TagSerializer
@@ -65,36 +144,113 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class FollowersView(APIView):
-    queryset = Followers.objects.all()
-    permission_classes = (IsAuthenticated, )
+class RelationMixin:
+    """связи пользователя с объектами: избранное, корзина, подписки."""
+    permission_classes = (IsAuthenticated,)
+    model = None
+    target = Recipe
+    field = 'recipe'
+    counter = None
+    relation = None
+
+    def get_rejected(self, user):
+        """id, связь с которыми запрещена."""
+        return set()
+
+    def changed(self, user, ids, delta):
+        """сдвигает счётчики объектов, у которых изменилась связь."""
+        self.target.objects.filter(pk__in=ids).shift(self.counter, delta)
+
+
+class FavoriteMixin(RelationMixin):
+    model = Favorite
+    counter = 'favorites_count'
+    relation = FAVORITES
+
+
+class ShoppingCartMixin(RelationMixin):
+    model = ShoppingList
+    counter = 'in_carts_count'
+    relation = SHOPPING_CART
+
+    def changed(self, user, ids, delta):
+        super().changed(user, ids, delta)
+        if delta > 0:
+            ShoppingCartIngredient.objects.add_recipes(user, ids)
+        else:
+            ShoppingCartIngredient.objects.remove_recipes(user, ids)
+
+
+class FollowersMixin(RelationMixin):
+    model = Followers
+    target = User
+    field = 'author'
+    counter = 'followers_count'
+    relation = SUBSCRIPTIONS
+
+    def get_rejected(self, user):
+        return {user.pk}
+
+
+class RelationView(RelationMixin, APIView):
+    """одна связь: вставка и удаление одной командой без проверок заранее.
+
+    Ответ определяется числом затронутых строк, поэтому повторный или
+    параллельный запрос не создаёт дубликат и не сдвигает счётчики
+    дважды. Объект ищется только при неудаче, чтобы отличить 404 от 400.
+    """
+    response_serializer = UserFavoriteSerializer
+    exists_message = None
+    missing_message = None
+    rejected_message = None
+
+    def failure(self, pk, message):
+        if not self.target.objects.filter(pk=pk).exists():
+            raise NotFound()
+        return Response(
+            {'errors': message}, status=status.HTTP_400_BAD_REQUEST)
 
     def post(self, request, id):
-        data = {
-            'user': request.user.id,
-            'author': id
-        }
-        serializer = FollowUsersSerializer(
-            data=data,
-            context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        user = request.user
+        if id in self.get_rejected(user):
+            return Response({'errors': self.rejected_message},
+                            status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            created = self.model.objects.link(user, self.field, id)
+            if created:
+                self.changed(user, [id], 1)
+                instance = get_object_or_404(self.target, pk=id)
+        if not created:
+            return self.failure(id, self.exists_message)
+        bump_version(viewer_namespace(self.relation, user))
+        serializer = self.response_serializer(
+            instance, context={'request': request})
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete(self, request, id):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        subscription = get_object_or_404(
-            Followers, user=user, author=author
-        )
-        subscription.delete()
+        with transaction.atomic(), denormalized_by_caller():
+            deleted, _ = self.model.objects.filter(
+                user=user, **{f'{self.field}_id': id}).delete()
+            if deleted:
+                self.changed(user, [id], -1)
+        if not deleted:
+            return self.failure(id, self.missing_message)
+        bump_version(viewer_namespace(self.relation, user))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class FollowersView(FollowersMixin, RelationView):
+    response_serializer = UsersSerializer
+    exists_message = 'Вы уже подписаны!'
+    missing_message = 'Вы не подписаны на этого автора!'
+    rejected_message = 'Подписка на себя запрещена!'
+
+
 class UserFollowView(ListAPIView):
     permission_classes = (IsAuthenticated, )
     pagination_class = CustomPagination
+    keyset_ordering = ('id',)
     serializer_class = FollowerSerializer
 
     def get_queryset(self):
@@ -102,72 +258,136 @@ class UserFollowView(ListAPIView):
         return User.objects.filter(following__user=user)
 
 
-class FavoriteViewSet(APIView):
-    queryset = Favorite.objects.all()
-    permission_classes = (IsAuthenticated,)
-    pagination_class = CustomPagination
+class FavoriteViewSet(FavoriteMixin, RelationView):
+    exists_message = 'Рецепт уже в избранном!'
+    missing_message = 'Рецепта нет в избранном!'
 
-    def post(self, request, id):
-        data = {
-            'user': request.user.id,
-            'recipe': id
-        }
-        serializer = FavoriteSerializer(
-            data=data, context={'request': request}
-        )
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(
-            serializer.data, status=status.HTTP_201_CREATED)
 
-    def delete(self, request, id):
-        recipe = get_object_or_404(Recipe, id=id)
-        if Favorite.objects.filter(user=request.user, recipe=recipe).delete():
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+class ShoppingListView(ShoppingCartMixin, RelationView):
+    exists_message = 'Рецепт уже в корзине!'
+    missing_message = 'Рецепта нет в корзине!'
 
 
-class ShoppingListView(APIView):
-    permission_classes = (IsAuthenticated, )
+class BulkRelationView(RelationMixin, APIView):
+    """пакетное добавление и удаление связей пользователя с объектами.
 
-    def post(self, request, id):
-        data = {
-            'user': request.user.id,
-            'recipe': id
-        }
-        serializer = ShoppingListSerializer(
-            data=data, context={'request': request}
-        )
+    Все id проверяются одним запросом с IN, запись - одним INSERT или
+    одним DELETE. Строка пользователя блокируется на время операции,
+    поэтому счётчики сдвигаются ровно на число изменённых связей.
+    """
+    def get_ids(self, request):
+        data = request.data
+        if not data and 'ids' in request.query_params:
+            data = {'ids': request.query_params['ids'].split(',')}
+        elif isinstance(data, list):
+            data = {'ids': data}
+        serializer = BulkIdsSerializer(data=data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(
-            serializer.data, status=status.HTTP_201_CREATED)
+        return serializer.validated_data['ids']
 
-    def delete(self, request, id):
-        recipe = get_object_or_404(Recipe, id=id)
-        if ShoppingList.objects.filter(
-                user=request.user, recipe=recipe
-        ).delete():
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        return Response(status=status.HTTP_400_BAD_REQUEST)
+    def get_targets(self, user, ids):
+        return set(self.target.objects.filter(
+            pk__in=ids).values_list('pk', flat=True)) - self.get_rejected(user)
+
+    def get_status(self, user, pk, found, default):
+        if pk in found:
+            return default
+        if pk in self.get_rejected(user):
+            return 'invalid'
+        return 'not_found'
+
+    def get_existing(self, user, ids):
+        return set(self.model.objects.filter(
+            user=user, **{f'{self.field}_id__in': ids}
+        ).values_list(f'{self.field}_id', flat=True))
+
+    def lock(self, user):
+        list(User.objects.select_for_update().filter(
+            pk=user.pk).values_list('pk', flat=True))
+
+    def post(self, request):
+        ids, user = self.get_ids(request), request.user
+        with transaction.atomic():
+            self.lock(user)
+            found = self.get_targets(user, ids)
+            existing = self.get_existing(user, found)
+            created = [pk for pk in ids if pk in found - existing]
+            self.model.objects.bulk_create([
+                self.model(user=user, **{f'{self.field}_id': pk})
+                for pk in created
+            ], ignore_conflicts=True)
+            if created:
+                self.changed(user, created, 1)
+        if created:
+            bump_version(viewer_namespace(self.relation, user))
+        return Response({'results': [
+            {'id': pk, 'status': 'created' if pk in created
+             else self.get_status(user, pk, found, 'exists')}
+            for pk in ids
+        ]})
+
+    def delete(self, request):
+        ids, user = self.get_ids(request), request.user
+        with transaction.atomic():
+            self.lock(user)
+            found = self.get_targets(user, ids)
+            existing = self.get_existing(user, ids)
+            deleted = [pk for pk in ids if pk in existing]
+            if deleted:
+                self.changed(user, deleted, -1)
+                with denormalized_by_caller():
+                    self.model.objects.filter(
+                        user=user, **{f'{self.field}_id__in': deleted}
+                    ).delete()
+        if deleted:
+            bump_version(viewer_namespace(self.relation, user))
+        return Response({'results': [
+            {'id': pk, 'status': 'deleted' if pk in deleted
+             else self.get_status(user, pk, found, 'absent')}
+            for pk in ids
+        ]})
+
+
+class BulkFavoriteView(FavoriteMixin, BulkRelationView):
+    pass
+
+
+class BulkShoppingListView(ShoppingCartMixin, BulkRelationView):
+    pass
+
+
+class BulkFollowersView(FollowersMixin, BulkRelationView):
+    pass
 
 
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes(EXPORT_RENDERERS)
 def download_shopping_list(request):
-    ingredient_list = 'Cписок покупок:'
-    ingredients = RecipeIngredient.objects.filter(
-        recipe__shopping_cart__user=request.user
-    ).values(
-        'ingredient__name', 'ingredient__measurement_unit'
-    ).annotate(amount=Sum('amount'))
-    for num, i in enumerate(ingredients):
-        ingredient_list += (
-            f"\n{i['ingredient__name']} - "
-            f"{i['amount']} {i['ingredient__measurement_unit']}"
+    """список покупок потоком в формате ?format=txt|csv|json|pdf.
+
+    Готовый документ берётся из кэша по версии корзины пользователя и
+    версии справочника ингредиентов.
+    """
+    renderer = request.accepted_renderer
+    export_format = renderer.format
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type += f'; charset={renderer.charset}'
+    user = request.user
+    ingredients_version, = get_versions(INGREDIENTS)
+    group = f'{user.pk}-'
+    name = f'{group}{user.cart_version}-{ingredients_version}.{export_format}'
+    document = shopping_lists.open(name)
+    if document is not None:
+        response = FileResponse(document, content_type=content_type)
+    else:
+        response = StreamingHttpResponse(
+            shopping_lists.tee(
+                name, EXPORTS[export_format](shopping_list_rows(user)),
+                group=group),
+            content_type=content_type
         )
-        if num < ingredients.count() - 1:
-            ingredient_list += ', '
-    file = 'shopping_list'
-    response = HttpResponse(ingredient_list, 'Content-Type: application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="{file}.pdf"'
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{export_format}"')
     return response
@@ -110,6 +110,18 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# MAX_PIXELS ограничивает и память: копии PNG строятся из целого кадра
+RECIPE_IMAGE = {
+    'MAX_SIZE': int(os.getenv(
+        'RECIPE_IMAGE_MAX_SIZE', default=10 * 1024 * 1024)),
+    'MAX_PIXELS': int(os.getenv(
+        'RECIPE_IMAGE_MAX_PIXELS', default=25 * 1000 * 1000)),
+}
+
 AUTH_USER_MODEL = 'users.User'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -127,6 +139,50 @@ REST_FRAMEWORK = {
     ),
 }
 
+# В docker-compose кэш общий для всех воркеров - memcached. Файловый кэш
+# для локального запуска при MAX_ENTRIES записей удаляет случайную треть,
+# вместе с версиями из api/versions.py, поэтому предел взят с запасом.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND',
+    default='django.core.cache.backends.filebased.FileBasedCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache')),
+    }
+}
+
+if CACHE_BACKEND.endswith('.FileBasedCache'):
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv(
+            'CACHE_MAX_ENTRIES', default=100 * 1000)),
+    }
+
+RECIPE_FRAGMENT_TTL = 60 * 60 * 24
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+SHOPPING_LIST_CACHE = {
+    'LOCATION': os.getenv(
+        'SHOPPING_LIST_CACHE_LOCATION',
+        default=os.path.join(BASE_DIR, 'cache', 'shopping_lists')
+    ),
+    'MAX_SIZE': int(
+        os.getenv('SHOPPING_LIST_CACHE_MAX_SIZE', default=256 * 1024 * 1024)
+    ),
+}
+
+PAGINATION_COUNT = {
+    'MODE': os.getenv('PAGINATION_COUNT_MODE', default='cached'),
+    'TTL': int(os.getenv('PAGINATION_COUNT_TTL', default=60)),
+    'ESTIMATE_THRESHOLD': 10000,
+}
+
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
@@ -17,13 +17,13 @@ class IngredientAdmin(admin.ModelAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'text', 'author', 'name',)
+    list_display = ('id', 'text', 'author', 'name', 'is_favorited')
     inlines = (IngredientInLine,)
     list_filter = ('author', 'name', 'tags',)
     empty_value_display = '-пусто-'
 
     def is_favorited(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     is_favorited.short_description = 'В избранном'
 
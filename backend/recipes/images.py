@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .storage import lock_name
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'variants'
+VARIANTS = (
+    ('thumbnail', 160),
+    ('card', 480),
+    ('full', 1280),
+)
+LARGEST = max(size for _, size in VARIANTS)
+FORMATS = (
+    ('jpeg', 'jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+    ('webp', 'webp', {'quality': 80, 'method': 4}),
+)
+# увеличить, чтобы копии получили новые адреса без смены настроек выше
+VARIANTS_VERSION = 1
+
+
+def variant_spec(size, extension, options):
+    """короткий хэш настроек копии: они меняются - меняется и адрес.
+
+    Копии отдаются с Cache-Control: immutable, поэтому пережатая копия
+    должна лежать по новому пути, а не поверх старой.
+    """
+    signature = repr(
+        (VARIANTS_VERSION, size, extension, sorted(options.items())))
+    return hashlib.md5(signature.encode()).hexdigest()[:8]
+
+
+SPECS = {
+    (variant, extension): variant_spec(size, extension, options)
+    for variant, size in VARIANTS
+    for _, extension, options in FORMATS
+}
+
+
+def variant_name(name, variant, extension):
+    """путь копии рядом с оригиналом.
+
+    variants/<имя>_<вариант>.<хэш настроек>.<формат>
+    """
+    head, tail = os.path.split(name)
+    stem = os.path.splitext(tail)[0]
+    spec = SPECS[variant, extension]
+    return os.path.join(
+        head, VARIANTS_DIR, f'{stem}_{variant}.{spec}.{extension}')
+
+
+def variant_names(name):
+    """{вариант: {формат: путь}} для исходного файла name."""
+    return {
+        variant: {
+            image_format: variant_name(name, variant, extension)
+            for image_format, extension, _ in FORMATS
+        }
+        for variant, _ in VARIANTS
+    }
+
+
+def flatten(image):
+    """RGB без прозрачности и с поворотом по EXIF."""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (
+            image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def make_variants(field_file, force=False):
+    """записывает недостающие копии изображения, возвращает их число.
+
+    Копии не больше исходника: маленькие картинки только пережимаются.
+    draft уменьшает при чтении только JPEG; PNG и остальные форматы
+    раскодируются целиком, до MAX_PIXELS пикселей в памяти Pillow.
+    """
+    storage, name = field_file.storage, field_file.name
+    missing = [
+        (variant, size, image_format, extension, options)
+        for variant, size in VARIANTS
+        for image_format, extension, options in FORMATS
+        if force or not storage.exists(
+            variant_name(name, variant, extension))
+    ]
+    if not missing:
+        return 0
+    try:
+        with storage.open(name) as file:
+            image = Image.open(file)
+            image.draft('RGB', (LARGEST, LARGEST))
+            source = flatten(image)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        logger.warning('Не удалось открыть изображение %s: %s', name, error)
+        return 0
+    resized = {}
+    for variant, size, image_format, extension, options in missing:
+        if variant not in resized:
+            resized[variant] = source.copy()
+            resized[variant].thumbnail((size, size), Image.LANCZOS)
+        buffer = BytesIO()
+        resized[variant].save(buffer, image_format, **options)
+        storage.save_as(
+            variant_name(name, variant, extension),
+            ContentFile(buffer.getvalue()))
+    return len(missing)
+
+
+def delete_image(storage, name):
+    """удаляет файл изображения вместе с его копиями."""
+    storage.delete(name)
+    for formats in variant_names(name).values():
+        for path in formats.values():
+            storage.delete(path)
+
+
+def release_image(name):
+    """удаляет файл, если на него больше не ссылается ни один рецепт.
+
+    Одинаковые загрузки делят один файл, поэтому при удалении рецепта
+    или смене картинки файл остаётся, пока у него есть владельцы.
+    Проверка и удаление идут под той же блокировкой имени, что и запись
+    файла при загрузке: параллельная загрузка того же файла либо уже
+    видна проверке, либо ждёт удаления и пишет файл заново.
+    """
+    if not name:
+        return
+    with transaction.atomic():
+        lock_name(name)
+        if Recipe.objects.filter(image=name).exists():
+            return
+        delete_image(Recipe._meta.get_field('image').storage, name)
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.versions import RECIPES, bump_version
+from recipes.images import make_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Пересоздать копии по тем же путям, даже если они уже есть. '
+                 'Чтобы сменить адреса копий, увеличьте VARIANTS_VERSION '
+                 'в recipes/images.py.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        images = written = 0
+        names = Recipe.objects.exclude(image='').order_by(
+            'image').values_list('image', flat=True).distinct()
+        field = Recipe._meta.get_field('image')
+        for name in names.iterator():
+            written += make_variants(
+                field.attr_class(None, field, name), force=options['force'])
+            images += 1
+        if written:
+            bump_version(RECIPES)
+        self.stdout.write(
+            f'Изображений: {images}, записано копий: {written}, '
+            f'{time.monotonic() - started:.1f} с')
@@ -0,0 +1,97 @@
+import os
+import time
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+
+from api.fragments import CATALOG
+from api.versions import RECIPES, bump_version
+from recipes.images import (VARIANTS_DIR, make_variants, release_image,
+                            variant_names)
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Переводит изображения рецептов на имена по хэшу содержимого '
+        'и удаляет файлы, на которые не ссылается ни один рецепт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что будет сделано.')
+        parser.add_argument(
+            '--grace', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд.')
+        parser.add_argument(
+            '--no-dedupe', action='store_true',
+            help='Не переименовывать файлы со старыми именами.')
+
+    def handle(self, *args, **options):
+        self.field = Recipe._meta.get_field('image')
+        self.storage = self.field.storage
+        if not options['no_dedupe']:
+            self.dedupe(options['dry_run'])
+        self.collect(options['dry_run'], options['grace'])
+
+    def image_names(self):
+        return Recipe.objects.exclude(image='').order_by('image').values_list(
+            'image', flat=True).distinct().iterator()
+
+    def dedupe(self, dry_run):
+        """старые имена со случайными суффиксами заменяются хэшем.
+
+        update() обходит сигналы, поэтому версии сдвигаются здесь: иначе
+        закэшированные фрагменты ссылались бы на удаляемые оригиналы.
+        """
+        renamed = 0
+        for name in list(self.image_names()):
+            if self.storage.is_hashed(name) or not self.storage.exists(name):
+                continue
+            renamed += 1
+            if dry_run:
+                continue
+            with self.storage.open(name) as file:
+                hashed = self.storage.save(name, File(file, name))
+            Recipe.objects.filter(image=name).update(image=hashed)
+            make_variants(self.field.attr_class(None, self.field, hashed))
+        if renamed and not dry_run:
+            bump_version(RECIPES, CATALOG)
+        self.stdout.write(f'Переименовано изображений: {renamed}')
+
+    def collect(self, dry_run, grace):
+        """удаляет файлы без ссылок из рецептов, кроме совсем новых.
+
+        Оригиналы удаляет release_image: под блокировкой имени она ещё раз
+        проверяет, что рецепта с файлом не появилось.
+        """
+        referenced = set()
+        for name in self.image_names():
+            referenced.add(name)
+            for formats in variant_names(name).values():
+                referenced.update(formats.values())
+        expired = time.time() - grace
+        removed = freed = 0
+        root = self.storage.location
+        for directory, _, files in os.walk(root):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if name in referenced or stat.st_mtime > expired:
+                    continue
+                removed += 1
+                freed += stat.st_size
+                if dry_run:
+                    continue
+                if VARIANTS_DIR in name.split('/'):
+                    os.unlink(path)
+                else:
+                    release_image(name)
+        action = 'Будет удалено' if dry_run else 'Удалено'
+        self.stdout.write(
+            f'{action} файлов: {removed}, {freed / 1024 / 1024:.1f} МБ')
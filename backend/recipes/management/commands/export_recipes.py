@@ -0,0 +1,119 @@
+import json
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from recipes.models import Recipe, RecipeIngredient
+
+
+def last_exported_id(path):
+    """id последнего целого рецепта в файле; недописанный хвост отрезается."""
+    last_id, end = 0, 0
+    with open(path, 'rb+') as file:
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                last_id = json.loads(line)['id']
+            except (ValueError, KeyError, TypeError):
+                break
+            end = file.tell()
+        file.truncate(end)
+    return last_id
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает рецепты с тегами, ингредиентами, автором и путём '
+        'к изображению в JSON Lines, по строке на рецепт.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию stdout.')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--after-id', type=int, default=0,
+            help='Начать с рецептов с id больше заданного.')
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Дописать файл, продолжив с последнего рецепта в нём.')
+
+    def handle(self, *args, **options):
+        output, last_id = options['output'], options['after_id']
+        if options['resume']:
+            if output == '-':
+                raise CommandError('--resume работает только с файлом.')
+            if os.path.exists(output):
+                last_id = max(last_id, last_exported_id(output))
+        started = time.monotonic()
+        if output == '-':
+            exported = self.export(sys.stdout, last_id, options)
+        else:
+            with open(output, 'a' if options['resume'] else 'w',
+                      encoding='utf-8') as file:
+                exported = self.export(file, last_id, options)
+        elapsed = time.monotonic() - started
+        rate = exported / elapsed if elapsed else 0
+        self.stderr.write(
+            f'Выгружено рецептов: {exported} за {elapsed:.2f} с '
+            f'({rate:.0f} строк/с).')
+
+    def export(self, file, last_id, options):
+        chunk_size = options['chunk_size']
+        exported = 0
+        started = time.monotonic()
+        while True:
+            chunk = self.chunk(last_id, chunk_size)
+            if not chunk:
+                return exported
+            for row in chunk:
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+            file.flush()
+            exported += len(chunk)
+            last_id = chunk[-1]['id']
+            if options['verbosity'] > 1:
+                elapsed = time.monotonic() - started
+                self.stderr.write(
+                    f'  до id {last_id}: {exported}, '
+                    f'{exported / elapsed:.0f} строк/с')
+
+    @staticmethod
+    def chunk(last_id, chunk_size):
+        """следующие chunk_size рецептов по id и их связи - три запроса."""
+        recipes = list(Recipe.objects.filter(pk__gt=last_id).order_by(
+            'pk').values(
+                'id', 'name', 'text', 'image', 'cooking_time', 'pub_date',
+                author_email=F('author__email'))[:chunk_size])
+        if not recipes:
+            return recipes
+        ids = [recipe['id'] for recipe in recipes]
+        tags, ingredients = {}, {}
+        for recipe_id, slug in Recipe.tags.through.objects.filter(
+                recipe_id__in=ids).order_by('pk').values_list(
+                    'recipe_id', 'tag__slug'):
+            tags.setdefault(recipe_id, []).append(slug)
+        for recipe_id, name, unit, amount in (
+                RecipeIngredient.objects.filter(recipe_id__in=ids).order_by(
+                    'pk').values_list(
+                        'recipe_id', 'ingredient__name',
+                        'ingredient__measurement_unit', 'amount')):
+            ingredients.setdefault(recipe_id, []).append([name, unit, amount])
+        return [
+            {
+                'id': recipe['id'],
+                'author': recipe['author_email'],
+                'name': recipe['name'],
+                'text': recipe['text'],
+                'image': recipe['image'],
+                'cooking_time': recipe['cooking_time'],
+                'pub_date': recipe['pub_date'].isoformat(),
+                'tags': tags.get(recipe['id'], []),
+                'ingredients': ingredients.get(recipe['id'], []),
+            }
+            for recipe in recipes
+        ]
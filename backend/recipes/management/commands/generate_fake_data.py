@@ -0,0 +1,243 @@
+import random
+import time
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+
+from api.fragments import CATALOG
+from api.versions import RECIPES, bump_version
+from recipes.images import make_variants
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingList, Tag)
+from users.models import Followers, User
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+    ('Десерт', '#F5A623', 'dessert'),
+    ('Выпечка', '#D0021B', 'bakery'),
+)
+WORDS = (
+    'салат', 'суп', 'пирог', 'запеканка', 'рагу', 'паста', 'каша',
+    'омлет', 'оладьи', 'котлеты', 'плов', 'борщ', 'торт', 'смузи',
+    'домашний', 'быстрый', 'летний', 'сытный', 'лёгкий', 'острый',
+    'овощной', 'сливочный', 'бабушкин', 'праздничный', 'постный',
+)
+
+
+def cumulative_zipf(count, exponent):
+    """накопленные веса закона Ципфа для choices(cum_weights=...)."""
+    weights, total = [], 0.0
+    for rank in range(1, count + 1):
+        total += rank ** -exponent
+        weights.append(total)
+    return weights
+
+
+def chunked(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт воспроизводимый набор пользователей, подписок, рецептов, '
+        'избранного и корзин для нагрузочных проверок.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок пользователя.')
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном.')
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Среднее число рецептов в корзине.')
+        parser.add_argument(
+            '--exponent', type=float, default=1.1,
+            help='Показатель степенного закона популярности.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--password', default='foodgram',
+            help='Пароль всех созданных пользователей.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.started = time.monotonic()
+        if not Ingredient.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        self.ingredients = dict(Ingredient.objects.order_by(
+            'pk').values_list('id', 'name'))
+        self.ingredient_ids = list(self.ingredients)
+        if len(self.ingredient_ids) < 30:
+            raise CommandError('В справочнике меньше 30 ингредиентов.')
+        self.tag_ids = self.create_tags()
+        self.image = self.create_image()
+        user_ids = self.create_users()
+        authors, author_weights = self.popularity(user_ids)
+        self.write(Followers, self.follows(user_ids, authors, author_weights))
+        recipe_ids = self.create_recipes(authors, author_weights)
+        recipes, recipe_weights = self.popularity(recipe_ids)
+        self.write(Favorite, self.links(
+            Favorite, user_ids, recipes, recipe_weights,
+            options['favorites']))
+        self.write(ShoppingList, self.links(
+            ShoppingList, user_ids, recipes, recipe_weights,
+            options['cart']))
+        self.reset_sequences()
+        call_command('rebuild_counters', stdout=self.stdout)
+        call_command('rebuild_cart_totals', stdout=self.stdout)
+        bump_version(RECIPES, CATALOG)
+        self.stdout.write(
+            f'Готово за {time.monotonic() - self.started:.1f} с.')
+
+    def create_tags(self):
+        Tag.objects.bulk_create(
+            [Tag(name=name, color=color, slug=slug)
+             for name, color, slug in TAGS],
+            ignore_conflicts=True)
+        return list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_image(self):
+        """одна картинка на все рецепты: по хэшу она хранится один раз."""
+        color = tuple(self.random.randrange(256) for _ in range(3))
+        buffer = BytesIO()
+        Image.new('RGB', (800, 600), color).save(buffer, 'JPEG')
+        field = Recipe._meta.get_field('image')
+        name = field.storage.save('fake.jpg', ContentFile(buffer.getvalue()))
+        make_variants(field.attr_class(None, field, name))
+        return name
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def create_users(self):
+        first = self.next_id(User)
+        ids = range(first, first + self.options['users'])
+        password = make_password(self.options['password'])
+        self.write(User, (
+            User(
+                pk=pk, email=f'fake{pk}@example.com', username=f'fake{pk}',
+                first_name=f'Имя{pk}', last_name=f'Фамилия{pk}',
+                password=password)
+            for pk in ids))
+        return list(ids)
+
+    def popularity(self, ids):
+        """ids в случайном порядке и веса: первые самые популярные."""
+        ranked = list(ids)
+        self.random.shuffle(ranked)
+        return ranked, cumulative_zipf(len(ranked), self.options['exponent'])
+
+    def sample(self, population, weights, count, exclude=None):
+        """count разных элементов с учётом весов."""
+        count = min(count, len(population) // 2)
+        chosen = set()
+        while len(chosen) < count:
+            for item in self.random.choices(
+                    population, cum_weights=weights, k=count - len(chosen)):
+                if item != exclude:
+                    chosen.add(item)
+        return sorted(chosen)
+
+    def follows(self, user_ids, authors, weights):
+        """подписок у всех поровну в среднем, подписчиков - по Ципфу."""
+        mean = self.options['follows']
+        for user_id in user_ids:
+            for author_id in self.sample(
+                    authors, weights, self.random.randint(0, 2 * mean),
+                    exclude=user_id):
+                yield Followers(user_id=user_id, author_id=author_id)
+
+    def links(self, model, user_ids, recipes, weights, mean):
+        for user_id in user_ids:
+            for recipe_id in self.sample(
+                    recipes, weights, self.random.randint(0, 2 * mean)):
+                yield model(user_id=user_id, recipe_id=recipe_id)
+
+    def create_recipes(self, authors, weights):
+        """рецепты с 5-30 ингредиентами и 1-3 тегами, пачками."""
+        first = self.next_id(Recipe)
+        ids = range(first, first + self.options['recipes'])
+        started = time.monotonic()
+        rows = 0
+        for batch in chunked(ids, self.batch_size):
+            recipes, amounts, links = [], [], []
+            for pk in batch:
+                ingredient_ids = self.random.sample(
+                    self.ingredient_ids, self.random.randint(5, 30))
+                name = ' '.join(self.random.sample(WORDS, 3)).capitalize()
+                text = ' '.join(self.random.choices(WORDS, k=40))
+                recipes.append(Recipe(
+                    pk=pk,
+                    author_id=self.random.choices(
+                        authors, cum_weights=weights)[0],
+                    name=name,
+                    text=text,
+                    image=self.image,
+                    cooking_time=self.random.randint(5, 180),
+                    search_document=Recipe.make_search_document(
+                        name, text,
+                        [self.ingredients[key] for key in ingredient_ids]),
+                ))
+                amounts.extend(
+                    RecipeIngredient(
+                        recipe_id=pk, ingredient_id=ingredient_id,
+                        amount=self.random.randint(1, 1000))
+                    for ingredient_id in ingredient_ids)
+                links.extend(
+                    Recipe.tags.through(recipe_id=pk, tag_id=tag_id)
+                    for tag_id in self.random.sample(
+                        self.tag_ids, self.random.randint(
+                            1, min(3, len(self.tag_ids)))))
+            with transaction.atomic():
+                Recipe.objects.bulk_create(recipes)
+                RecipeIngredient.objects.bulk_create(amounts)
+                Recipe.tags.through.objects.bulk_create(links)
+            rows += len(recipes) + len(amounts) + len(links)
+        self.report('Recipe, RecipeIngredient, tags', rows, started)
+        return list(ids)
+
+    def write(self, model, objects):
+        started = time.monotonic()
+        rows = 0
+        for batch in chunked(objects, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            rows += len(batch)
+        self.report(model.__name__, rows, started)
+
+    def report(self, title, rows, started):
+        elapsed = time.monotonic() - started
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{title}: {rows} строк за {elapsed:.1f} с ({rate:.0f} строк/с)')
+
+    @staticmethod
+    def reset_sequences():
+        """после вставки с явными id счётчики ключей догоняют таблицы."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [User, Recipe]):
+                cursor.execute(sql)
@@ -0,0 +1,215 @@
+import json
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from api.versions import RECIPES, bump_version
+from recipes.images import make_variants
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает рецепты из JSON Lines, выгруженного export_recipes. '
+        'Рецепт, уже найденный по автору, названию и дате публикации, '
+        'пропускается, поэтому прерванную загрузку можно просто запустить '
+        'ещё раз. Рецепты сохраняют свои id, а если id занят другим '
+        'рецептом, получают новый.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Файл JSON Lines.')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--no-variants', action='store_true',
+            help='Не создавать уменьшенные копии изображений.')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.stats = dict.fromkeys(
+            ('read', 'created', 'existing', 'unresolved', 'renumbered'), 0)
+        self.started = time.monotonic()
+        self.next_id = max(
+            max((row['id'] for row in self.read(options['input'])),
+                default=0),
+            Recipe.objects.aggregate(top=Max('pk'))['top'] or 0
+        ) + 1
+        rows = []
+        for row in self.read(options['input']):
+            rows.append(row)
+            if len(rows) >= options['chunk_size']:
+                self.load(rows)
+                rows = []
+        if rows:
+            self.load(rows)
+        self.reset_sequence()
+        self.report()
+
+    @staticmethod
+    def read(path):
+        with open(path, encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as error:
+                    raise CommandError(f'Строка {number}: {error}')
+
+    def load(self, rows):
+        """пачка рецептов: четыре запроса на чтение и пять на запись."""
+        self.stats['read'] += len(rows)
+        authors = dict(User.objects.filter(
+            email__in={row['author'] for row in rows}).values_list(
+                'email', 'id'))
+        rows = self.skip_existing(rows, authors)
+        catalog = {
+            (name, unit): pk
+            for pk, name, unit in Ingredient.objects.filter(name__in={
+                name for row in rows for name, _, _ in row['ingredients']
+            }).values_list('id', 'name', 'measurement_unit')
+        }
+        taken = set(Recipe.objects.filter(
+            pk__in=[row['id'] for row in rows]).values_list('pk', flat=True))
+        recipes = []
+        for row in rows:
+            resolved = self.resolve(row, authors, catalog)
+            if resolved is None:
+                self.stats['unresolved'] += 1
+            else:
+                if row['id'] in taken:
+                    self.renumber(resolved[0])
+                recipes.append(resolved)
+        if recipes:
+            self.save(recipes)
+        self.progress()
+
+    def skip_existing(self, rows, authors):
+        """строки без рецепта с тем же автором, названием и датой."""
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values(),
+            name__in={row['name'] for row in rows}).values_list(
+                'author_id', 'name', 'pub_date'))
+        new = [
+            row for row in rows
+            if (authors.get(row['author']), row['name'],
+                parse_datetime(row['pub_date'])) not in existing
+        ]
+        self.stats['existing'] += len(rows) - len(new)
+        return new
+
+    def resolve(self, row, authors, catalog):
+        """рецепт с ключами по естественным ключам или None, если их нет."""
+        author_id = authors.get(row['author'])
+        tag_ids = {self.tags.get(slug) for slug in row['tags']}
+        ingredient_amounts = defaultdict(int)
+        for name, unit, amount in row['ingredients']:
+            ingredient_amounts[catalog.get((name, unit))] += amount
+        if None in (author_id, *tag_ids, *ingredient_amounts):
+            self.stderr.write(
+                f'Рецепт {row["id"]}: не найден автор, тег или ингредиент.')
+            return None
+        recipe = Recipe(
+            pk=row['id'],
+            author_id=author_id,
+            name=row['name'],
+            text=row['text'],
+            image=row['image'],
+            cooking_time=row['cooking_time'],
+            pub_date=parse_datetime(row['pub_date']),
+            search_document=Recipe.make_search_document(
+                row['name'], row['text'],
+                [name for name, _, _ in row['ingredients']]),
+        )
+        return recipe, tag_ids, ingredient_amounts
+
+    def renumber(self, recipe):
+        """рецепт, чей id занят другим рецептом, - под новым id.
+
+        Новые id выдаются выше всех id файла и таблицы, поэтому не
+        занимают id рецептов из следующих пачек.
+        """
+        self.stderr.write(
+            f'Рецепт {recipe.pk}: id занят другим рецептом, '
+            f'добавлен с id {self.next_id}.')
+        recipe.pk = self.next_id
+        self.next_id += 1
+        self.stats['renumbered'] += 1
+
+    def save(self, resolved):
+        """рецепты с их тегами и ингредиентами одной пачкой."""
+        recipes = [recipe for recipe, _, _ in resolved]
+        pub_dates = [recipe.pub_date for recipe in recipes]
+        authors = defaultdict(int)
+        for recipe in recipes:
+            authors[recipe.author_id] += 1
+        by_delta = defaultdict(list)
+        for author_id, delta in authors.items():
+            by_delta[delta].append(author_id)
+        with transaction.atomic():
+            Recipe.objects.bulk_create(recipes)
+            for recipe, pub_date in zip(recipes, pub_dates):
+                recipe.pub_date = pub_date
+            Recipe.objects.bulk_update(recipes, ['pub_date'])
+            Recipe.tags.through.objects.bulk_create([
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for recipe, tag_ids, _ in resolved
+                for tag_id in tag_ids
+            ])
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                    amount=amount)
+                for recipe, _, ingredient_amounts in resolved
+                for ingredient_id, amount in ingredient_amounts.items()
+            ])
+            for delta, author_ids in by_delta.items():
+                User.objects.filter(pk__in=author_ids).shift(
+                    'recipes_count', delta)
+            bump_version(RECIPES)
+        self.stats['created'] += len(recipes)
+        if not self.options['no_variants']:
+            self.make_variants(recipes)
+
+    @staticmethod
+    def make_variants(recipes):
+        for recipe in recipes:
+            if recipe.image and recipe.image.storage.exists(recipe.image.name):
+                make_variants(recipe.image)
+
+    @staticmethod
+    def reset_sequence():
+        """после вставки с явными id счётчик ключей догоняет таблицу."""
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Recipe]):
+                cursor.execute(sql)
+
+    def throughput(self):
+        elapsed = time.monotonic() - self.started
+        return self.stats['read'] / elapsed if elapsed else 0
+
+    def progress(self):
+        if self.options['verbosity'] > 1:
+            self.stdout.write(
+                f'  прочитано {self.stats["read"]}, '
+                f'{self.throughput():.0f} строк/с')
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        stats = self.stats
+        self.stdout.write(
+            f'Прочитано рецептов: {stats["read"]}, '
+            f'добавлено: {stats["created"]}, '
+            f'уже в базе: {stats["existing"]}, '
+            f'с новым id: {stats["renumbered"]}, '
+            f'не удалось сопоставить: {stats["unresolved"]}.')
+        self.stdout.write(
+            f'Загрузка рецептов завершена за {elapsed:.2f} с '
+            f'({self.throughput():.0f} строк/с).')
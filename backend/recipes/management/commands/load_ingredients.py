@@ -1,20 +1,171 @@
 import csv
-from django.core.management.base import BaseCommand
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.fragments import CATALOG
+from api.search import INGREDIENTS
+from api.versions import bump_version
 from recipes.models import Ingredient
 
+NAME_LENGTH = Ingredient._meta.get_field('name').max_length
+UNIT_LENGTH = Ingredient._meta.get_field('measurement_unit').max_length
+
+
+def read_csv(file):
+    """строки «название,единица», заголовок пропускается."""
+    for row in csv.reader(file):
+        if row[:2] == ['name', 'measurement_unit']:
+            continue
+        yield (row[0], row[1]) if len(row) >= 2 else None
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """объекты из JSON-массива или JSON Lines без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer, position = '', 0
+    while True:
+        while position < len(buffer) and buffer[position] in '[], \t\r\n':
+            position += 1
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                if buffer[position:].strip():
+                    raise CommandError(
+                        f'Ошибка в JSON: {buffer[position:position + 80]}')
+                return
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if isinstance(item, dict):
+            yield item.get('name'), item.get('measurement_unit')
+        else:
+            yield None
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
 
 class Command(BaseCommand):
+    help = (
+        'Загружает справочник ингредиентов из CSV или JSON, '
+        'добавляя только новые пары «название, единица».'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='Файл CSV, JSON или JSON Lines.')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла, если его не видно по расширению.')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать, что будет добавлено.')
+
     def handle(self, *args, **options):
-        self.import_ingredients()
-        print('Загрузка ингредиентов завершена.')
-
-    def import_ingredients(self, file='ingredients.csv'):
-        print(f'Загрузка {file}...')
-        file_path = f'./data/{file}'
-        with open(file_path, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                status, created = Ingredient.objects.update_or_create(
-                    name=row[0],
-                    measurement_unit=row[1]
-                )
+        path = options['path']
+        reader = READERS[options['format'] or self.detect_format(path)]
+        self.dry_run = options['dry_run']
+        self.chunk_size = options['chunk_size']
+        self.verbose = options['verbosity'] > 1
+        self.stats = dict.fromkeys(
+            ('read', 'created', 'existing', 'duplicate', 'invalid'), 0)
+        self.started = time.monotonic()
+        self.stdout.write(f'Загрузка {path}...')
+        with open(path, newline='', encoding='utf-8-sig') as file:
+            with transaction.atomic():
+                self.load(reader(file))
+                if self.stats['created'] and not self.dry_run:
+                    bump_version(CATALOG, INGREDIENTS)
+        self.report()
+
+    @staticmethod
+    def detect_format(path):
+        extension = os.path.splitext(path)[1].lower().lstrip('.')
+        if extension in ('json', 'jsonl'):
+            return 'json'
+        if extension == 'csv':
+            return 'csv'
+        with open(path, encoding='utf-8-sig') as file:
+            start = file.read(1024).lstrip()[:1]
+        return 'json' if start in ('[', '{') else 'csv'
+
+    def load(self, rows):
+        """сверяет строки с ключами из базы и пишет новые пачками."""
+        existing = set(Ingredient.objects.values_list(
+            'name', 'measurement_unit').iterator())
+        added = set()
+        batch = []
+        for row in rows:
+            self.stats['read'] += 1
+            key = self.clean(row)
+            if key is None:
+                self.stats['invalid'] += 1
+            elif key in existing:
+                self.stats['existing'] += 1
+            elif key in added:
+                self.stats['duplicate'] += 1
+            else:
+                added.add(key)
+                batch.append(key)
+                if len(batch) >= self.chunk_size:
+                    self.write(batch)
+                    batch = []
+        if batch:
+            self.write(batch)
+
+    @staticmethod
+    def clean(row):
+        if row is None:
+            return None
+        name, unit = row
+        if not isinstance(name, str) or not isinstance(unit, str):
+            return None
+        name, unit = name.strip(), unit.strip()
+        if not name or not unit:
+            return None
+        if len(name) > NAME_LENGTH or len(unit) > UNIT_LENGTH:
+            return None
+        return name, unit
+
+    def write(self, batch):
+        if not self.dry_run:
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in batch],
+                ignore_conflicts=True)
+        self.stats['created'] += len(batch)
+        if self.verbose:
+            self.stdout.write(
+                f'  добавлено {self.stats["created"]}, '
+                f'{self.throughput():.0f} строк/с')
+
+    def throughput(self):
+        elapsed = time.monotonic() - self.started
+        return self.stats['read'] / elapsed if elapsed else 0
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        action = 'будет добавлено' if self.dry_run else 'добавлено'
+        stats = self.stats
+        self.stdout.write(
+            f'Прочитано строк: {stats["read"]}, '
+            f'{action}: {stats["created"]}, '
+            f'уже в базе: {stats["existing"]}, '
+            f'повторов в файле: {stats["duplicate"]}, '
+            f'некорректных: {stats["invalid"]}.')
+        self.stdout.write(
+            f'Загрузка ингредиентов завершена за {elapsed:.2f} с '
+            f'({self.throughput():.0f} строк/с).')
@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from recipes.models import RecipeIngredient, ShoppingCartIngredient
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+
+
+def live_totals(user_ids=None):
+    """суммы корзин, посчитанные заново по рецептам."""
+    lookup = {'recipe__shopping_cart__isnull': False}
+    if user_ids is not None:
+        lookup = {'recipe__shopping_cart__user__in': user_ids}
+    return RecipeIngredient.objects.filter(**lookup).values(
+        'ingredient_id', user_id=F('recipe__shopping_cart__user'),
+    ).annotate(
+        total_amount=Sum('amount'), recipe_count=Count('id')
+    ).values_list(
+        'user_id', 'ingredient_id', 'total_amount', 'recipe_count'
+    ).order_by('user_id', 'ingredient_id')
+
+
+def stored_totals():
+    return ShoppingCartIngredient.objects.values_list(
+        'user_id', 'ingredient_id', 'total_amount', 'recipe_count'
+    ).order_by('user_id', 'ingredient_id')
+
+
+def drifted_users(live, stored):
+    """пользователи, у которых сохранённые суммы расходятся с живыми.
+
+    Оба списка упорядочены по (пользователь, ингредиент) и сливаются
+    за один проход без загрузки в память.
+    """
+    drifted = set()
+    live, stored = iter(live), iter(stored)
+    left, right = next(live, None), next(stored, None)
+    while left is not None or right is not None:
+        if right is None or (left is not None and left[:2] < right[:2]):
+            drifted.add(left[0])
+            left = next(live, None)
+        elif left is None or right[:2] < left[:2]:
+            drifted.add(right[0])
+            right = next(stored, None)
+        else:
+            if left != right:
+                drifted.add(left[0])
+            left, right = next(live, None), next(stored, None)
+    return drifted
+
+
+class Command(BaseCommand):
+    help = 'Проверяет и пересчитывает суммы ингредиентов в корзинах.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить, ничего не изменяя.')
+
+    def handle(self, *args, **options):
+        drifted = sorted(drifted_users(
+            live_totals().iterator(), stored_totals().iterator()))
+        self.stdout.write(f'Корзин с расхождениями: {len(drifted)}')
+        if drifted and options['check']:
+            raise CommandError(f'Суммы корзин расходятся: {len(drifted)}')
+        for start in range(0, len(drifted), BATCH_SIZE):
+            self.rebuild(drifted[start:start + BATCH_SIZE])
+        self.stdout.write('Проверка корзин завершена.')
+
+    def rebuild(self, user_ids):
+        """новая версия корзины сбрасывает готовые списки покупок."""
+        with transaction.atomic():
+            User.objects.filter(pk__in=user_ids).update(
+                cart_version=F('cart_version') + 1)
+            ShoppingCartIngredient.objects.filter(
+                user_id__in=user_ids).delete()
+            ShoppingCartIngredient.objects.bulk_create(
+                ShoppingCartIngredient(
+                    user_id=user_id, ingredient_id=ingredient_id,
+                    total_amount=total_amount, recipe_count=recipe_count)
+                for user_id, ingredient_id, total_amount, recipe_count
+                in live_totals(user_ids).iterator())
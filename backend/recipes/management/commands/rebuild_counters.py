@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingList
+from users.models import Followers, User
+
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Followers, 'author'),
+)
+
+
+def count_subquery(model, field):
+    """количество связанных строк для OuterRef('pk')."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total'),
+        output_field=models.IntegerField()
+    ), 0)
+
+
+class Command(BaseCommand):
+    help = 'Проверяет и пересчитывает денормализованные счётчики.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только проверить, ничего не изменяя.')
+
+    def handle(self, *args, **options):
+        drifted = 0
+        with transaction.atomic():
+            for model, field, related, related_field in COUNTERS:
+                actual = count_subquery(related, related_field)
+                stale = model.objects.annotate(actual=actual).exclude(
+                    **{field: F('actual')}).count()
+                drifted += stale
+                self.stdout.write(
+                    f'{model.__name__}.{field}: расхождений {stale}')
+                if stale and not options['check']:
+                    model.objects.update(**{field: actual})
+        if drifted and options['check']:
+            raise CommandError(f'Счётчики расходятся: {drifted}')
+        self.stdout.write('Проверка счётчиков завершена.')
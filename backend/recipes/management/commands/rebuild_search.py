@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает текст для поиска по рецептам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        updated = 0
+        while True:
+            recipes = list(Recipe.objects.filter(pk__gt=last_id).order_by(
+                'pk').only('id', 'name', 'text')[:chunk_size])
+            if not recipes:
+                break
+            names = {}
+            for recipe_id, name in RecipeIngredient.objects.filter(
+                    recipe__in=recipes).values_list(
+                        'recipe_id', 'ingredient__name'):
+                names.setdefault(recipe_id, []).append(name)
+            for recipe in recipes:
+                recipe.search_document = Recipe.make_search_document(
+                    recipe.name, recipe.text, names.get(recipe.id, ()))
+            with transaction.atomic():
+                Recipe.objects.bulk_update(recipes, ['search_document'])
+            updated += len(recipes)
+            last_id = recipes[-1].pk
+        self.stdout.write(f'Обновлено рецептов: {updated}')
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:10
+
+from django.db import migrations, models
+
+SEARCH_VECTOR_SQL = '''
+ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian', search_document), 'B')
+    ) STORED;
+CREATE INDEX recipe_search_vector_idx
+    ON recipes_recipe USING GIN (search_vector);
+'''
+
+DROP_SEARCH_VECTOR_SQL = '''
+DROP INDEX IF EXISTS recipe_search_vector_idx;
+ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector;
+'''
+
+
+def fill_search_documents(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    names = {}
+    for recipe_id, name in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient__name'):
+        names.setdefault(recipe_id, []).append(name)
+    for recipe in Recipe.objects.only('id', 'name', 'text').iterator():
+        document = '\n'.join(
+            (recipe.name, ' '.join(names.get(recipe.id, ())), recipe.text))
+        Recipe.objects.filter(pk=recipe.pk).update(
+            search_document=document.lower().replace('ё', 'е'))
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SEARCH_VECTOR_SQL)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False, verbose_name='Текст для поиска'),
+        ),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
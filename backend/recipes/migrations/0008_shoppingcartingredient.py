@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-18 21:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+
+
+def fill_cart_ingredients(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingCartIngredient = apps.get_model(
+        'recipes', 'ShoppingCartIngredient')
+    rows = RecipeIngredient.objects.filter(
+        recipe__shopping_cart__isnull=False
+    ).values('recipe__shopping_cart__user', 'ingredient').annotate(
+        total=Sum('amount'), recipes=Count('id')
+    ).order_by().iterator()
+    batch = []
+    for row in rows:
+        batch.append(ShoppingCartIngredient(
+            user_id=row['recipe__shopping_cart__user'],
+            ingredient_id=row['ingredient'],
+            total_amount=row['total'],
+            recipe_count=row['recipes'],
+        ))
+        if len(batch) >= 1000:
+            ShoppingCartIngredient.objects.bulk_create(batch)
+            batch = []
+    ShoppingCartIngredient.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0007_recipe_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartIngredient',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('recipe_count', models.PositiveIntegerField(verbose_name='Рецептов в корзине')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.Ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в корзине',
+                'verbose_name_plural': 'Ингредиенты в корзине',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_cart_ingredient'),
+        ),
+        migrations.RunPython(fill_cart_ingredients, migrations.RunPython.noop),
+    ]
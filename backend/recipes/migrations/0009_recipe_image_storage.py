@@ -0,0 +1,19 @@
+# Generated by Django 2.2.16 on 2026-10-19 09:20
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_shoppingcartingredient'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=recipes.storage.ContentHashStorage(), upload_to='', verbose_name='Изображение блюда'),
+        ),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.db.models import Count, F, Sum
 from django.core.validators import MinValueValidator, MaxValueValidator
 
+from users.models import CounterFieldsMixin, CounterQuerySet, LinkQuerySet
+from .storage import ContentHashStorage
+
 User = get_user_model()
 
 
@@ -53,7 +57,7 @@ class Tag(models.Model):
         return f'{self.name}'
 
 
-class Recipe(models.Model):
+class Recipe(CounterFieldsMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -75,6 +79,7 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='',
+        storage=ContentHashStorage(),
         verbose_name='Изображение блюда'
     )
     tags = models.ManyToManyField(
@@ -94,15 +99,43 @@ class Recipe(models.Model):
             MinValueValidator(1, 'Время приготовления блада не может быть меньше 1 мин')
         ]
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В корзинах',
+        default=0,
+        editable=False
+    )
+    search_document = models.TextField(
+        verbose_name='Текст для поиска',
+        blank=True,
+        editable=False
+    )
+
+    objects = CounterQuerySet.as_manager()
+    counter_fields = ('favorites_count', 'in_carts_count')
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def make_search_document(name, text, ingredient_names):
+        """название первой строкой, затем ингредиенты и описание."""
+        document = '\n'.join((name, ' '.join(ingredient_names), text))
+        return document.lower().replace('ё', 'е')
+
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -150,6 +183,8 @@ class Favorite(models.Model):
         verbose_name='Рецепт'
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         ordering = ['-id']
         verbose_name = 'Список избранных рецептов'
@@ -178,6 +213,8 @@ class ShoppingList(models.Model):
         related_name='shopping_cart'
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт в корзине'
         verbose_name_plural = 'Рецепты в корзине'
@@ -192,6 +229,113 @@ class ShoppingList(models.Model):
         return f'{self.user} добавил в корзину {self.recipe}'
 
 
+class CartIngredientQuerySet(models.QuerySet):
+    """суммы ингредиентов в корзинах, обновляемые по разнице."""
+    batch_size = 500
+
+    def recipe_deltas(self, recipe_ids, sign=1):
+        """вклад рецептов в суммы: {ингредиент: (количество, рецептов)}."""
+        rows = RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient_id').annotate(
+            amount=Sum('amount'), recipes=Count('id')
+        ).order_by()
+        return {
+            row['ingredient_id']: (sign * row['amount'], sign * row['recipes'])
+            for row in rows
+        }
+
+    def add_recipes(self, user, recipe_ids):
+        self.apply([user.pk], self.recipe_deltas(recipe_ids))
+
+    def remove_recipes(self, user, recipe_ids):
+        self.apply([user.pk], self.recipe_deltas(recipe_ids, sign=-1))
+
+    def apply(self, user_ids, deltas):
+        """прибавляет deltas к суммам каждого из user_ids.
+
+        Версия корзины пользователя растёт в той же транзакции: это и
+        ключ готовых документов, и блокировка строки пользователя, чтобы
+        параллельные изменения одной корзины не теряли друг друга.
+        """
+        deltas = {
+            ingredient: delta for ingredient, delta in deltas.items()
+            if delta != (0, 0)
+        }
+        if not deltas:
+            return
+        user_ids = list(user_ids)
+        for start in range(0, len(user_ids), self.batch_size):
+            self.apply_batch(user_ids[start:start + self.batch_size], deltas)
+
+    def apply_batch(self, user_ids, deltas):
+        User.objects.filter(pk__in=user_ids).update(
+            cart_version=F('cart_version') + 1)
+        rows = {
+            (row.user_id, row.ingredient_id): row
+            for row in self.filter(
+                user_id__in=user_ids, ingredient_id__in=list(deltas))
+        }
+        created, changed, emptied = [], [], []
+        for user_id in user_ids:
+            for ingredient_id, (amount, recipes) in deltas.items():
+                row = rows.get((user_id, ingredient_id))
+                if row is None:
+                    if recipes > 0:
+                        created.append(self.model(
+                            user_id=user_id, ingredient_id=ingredient_id,
+                            total_amount=amount, recipe_count=recipes))
+                    continue
+                row.total_amount = max(row.total_amount + amount, 0)
+                row.recipe_count += recipes
+                if row.recipe_count > 0:
+                    changed.append(row)
+                else:
+                    emptied.append(row.pk)
+        if emptied:
+            self.filter(pk__in=emptied).delete()
+        if changed:
+            self.bulk_update(changed, ('total_amount', 'recipe_count'))
+        if created:
+            self.bulk_create(created)
+
+
+class ShoppingCartIngredient(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='cart_ingredients'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='+'
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Количество'
+    )
+    recipe_count = models.PositiveIntegerField(
+        verbose_name='Рецептов в корзине'
+    )
+
+    objects = CartIngredientQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в корзине'
+        verbose_name_plural = 'Ингредиенты в корзине'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_cart_ingredient'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.total_amount}'
+
+
 class TagRecipe(models.Model):
     recipe = models.ForeignKey(
         Recipe,
@@ -0,0 +1,87 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+def lock_name(name):
+    """блокирует имя файла до конца текущей транзакции.
+
+    Запись файла с этим именем и удаление последнего рецепта с ним
+    выполняются по очереди. Только Postgres: SQLite и так пишет
+    транзакции по одной.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [name])
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """файлы называются по SHA-256 содержимого.
+
+    Одинаковые загрузки получают одно имя и хранятся один раз, а файл
+    под выданным именем никогда не меняется, поэтому его можно
+    кэшировать навсегда.
+    """
+
+    @staticmethod
+    def is_hashed(name):
+        return bool(HASHED_NAME.search(name))
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        return os.path.join(
+            os.path.dirname(name), hexdigest[:2],
+            hexdigest + os.path.splitext(name)[1].lower())
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(name, content)
+        lock_name(name)
+        return super().save(name, content, max_length)
+
+    def save_as(self, name, content):
+        """записывает производный файл под заданным именем без хэша."""
+        self.delete(name)
+        return self._save(name, content)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        """пишет во временный файл и атомарно переименовывает.
+
+        Если файл уже есть, содержимое то же самое и запись не нужна.
+        """
+        if self.exists(name):
+            return name
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+            os.chmod(temporary, self.file_permissions_mode or 0o644)
+            os.replace(temporary, path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        return name
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 22:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='cart_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Версия корзины'),
+        ),
+    ]
@@ -1,10 +1,74 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.auth.models import UserManager as DjangoUserManager
+from django.db import connections, models
+from django.db.models import F
 from django.core.validators import RegexValidator
 from rest_framework.exceptions import ValidationError
 
 
-class User(AbstractUser):
+class CounterQuerySet(models.QuerySet):
+    """денормализованные счётчики без чтения строк."""
+
+    def shift(self, field, delta=1):
+        """сдвигает счётчик на delta, не уходя ниже нуля."""
+        queryset = self
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        return queryset.update(**{field: F(field) + delta})
+
+
+class CounterFieldsMixin:
+    """полное сохранение строки не трогает счётчики.
+
+    Счётчики меняет только CounterQuerySet.shift, а значения в объекте,
+    прочитанном до сдвига, устарели бы: save() из админки, djoser или
+    сериализатора иначе затёр бы их.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
+
+class LinkQuerySet(models.QuerySet):
+    """связи пользователя с объектами (подписки, избранное, корзина)."""
+
+    def link(self, user, field, pk):
+        """создаёт связь user с объектом pk по полю field одной командой.
+
+        Строка вставляется, только если объект существует и связи ещё
+        нет; возвращает число вставленных строк, 0 или 1.
+        """
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        meta = self.model._meta
+        target = meta.get_field(field).related_model._meta
+        key = quote(target.pk.column)
+        sql = (
+            f'INSERT INTO {quote(meta.db_table)} '
+            f'({quote(meta.get_field("user").column)}, '
+            f'{quote(meta.get_field(field).column)}) '
+            f'SELECT %s, {key} FROM {quote(target.db_table)} '
+            f'WHERE {key} = %s ON CONFLICT DO NOTHING'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user.pk, pk])
+            return cursor.rowcount
+
+
+class UserManager(DjangoUserManager.from_queryset(CounterQuerySet)):
+    pass
+
+
+class User(CounterFieldsMixin, AbstractUser):
     ADMIN = 'admin'
     USER = 'user'
     ROLES = [
@@ -40,6 +104,24 @@ class User(AbstractUser):
         choices=ROLES,
         default=USER,
         verbose_name='Роль')
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Количество рецептов',
+        default=0,
+        editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Количество подписчиков',
+        default=0,
+        editable=False
+    )
+    cart_version = models.PositiveIntegerField(
+        verbose_name='Версия корзины',
+        default=0,
+        editable=False
+    )
+
+    objects = UserManager()
+    counter_fields = ('recipes_count', 'followers_count', 'cart_version')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'password']
@@ -75,6 +157,8 @@ class Followers(models.Model):
         null=True,
     )
 
+    objects = LinkQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Подписчика'
         verbose_name_plural = 'Подписчиков'